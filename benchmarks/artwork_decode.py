@@ -0,0 +1,83 @@
+import argparse
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.banners import BannerRenderer, COVER_SIZE, MUSIC_BANNER_SIZE
+
+
+def make_artwork(size: int, kind: str = 'jpeg') -> bytes:
+    noise = Image.effect_noise((size, size), 64).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((size, size)).convert('RGB')
+    image = Image.blend(noise, gradient, 0.6).filter(ImageFilter.GaussianBlur(2))
+    buffer = BytesIO()
+    if kind == 'palette':
+        image.quantize(64).save(buffer, format='PNG')
+    else:
+        image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def legacy_pipeline(artwork_data: bytes):
+    width, height = MUSIC_BANNER_SIZE
+    album_art = Image.open(BytesIO(artwork_data))
+    if album_art.mode not in ('RGB', 'RGBA'):
+        album_art = album_art.convert('RGB')
+    album_art = album_art.resize(COVER_SIZE)
+
+    image = Image.open(BytesIO(artwork_data))
+    image = image.resize((150, 150))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.getcolors(150*150)
+
+    bg_image = album_art.resize((width, height))
+    bg_image = bg_image.filter(ImageFilter.GaussianBlur(radius=20))
+    return album_art, bg_image
+
+
+def current_pipeline(artwork_data: bytes):
+    width, height = MUSIC_BANNER_SIZE
+    album_art = BannerRenderer.load_artwork(artwork_data)
+    if album_art.size != COVER_SIZE:
+        album_art = album_art.resize(COVER_SIZE)
+    BannerRenderer.extract_palette(album_art)
+
+    bg_image = BannerRenderer.blurred_background(album_art, (width, height))
+    return album_art, bg_image
+
+
+def measure(pipeline, artwork_data: bytes, iterations: int) -> float:
+    pipeline(artwork_data)
+    start = time.process_time()
+    for _ in range(iterations):
+        pipeline(artwork_data)
+    return (time.process_time() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU cost of artwork decoding per banner")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1000])
+    parser.add_argument('--kinds', nargs='+', default=['jpeg', 'palette'], help="jpeg and/or palette (P-mode PNG)")
+    args = parser.parse_args()
+
+    print(f"{'kind':>8} {'artwork':>10} {'legacy ms':>10} {'current ms':>11} {'saved ms':>9} {'speedup':>8}")
+    for kind in args.kinds:
+        for size in args.sizes:
+            artwork_data = make_artwork(size, kind)
+            legacy = measure(legacy_pipeline, artwork_data, args.iterations)
+            current = measure(current_pipeline, artwork_data, args.iterations)
+            print(
+                f"{kind:>8} {size}x{size:<5} {legacy:>10.2f} {current:>11.2f} "
+                f"{legacy - current:>9.2f} {legacy / current:>7.1f}x"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import json
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.banners import BannerRenderer
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'banner_baseline.json'
+COMPARED_METRICS = ('cpu_ratio', 'bytes')
+REFERENCE_SIZE = (800, 300)
+
+LONG_CYRILLIC_TITLE = "Очень длинное название трека на кириллице, которое не помещается в баннер"
+LONG_CYRILLIC_AUTHOR = "Исполнитель с невероятно длинным псевдонимом и припиской"
+
+
+def encode_jpeg(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def solid_artwork() -> bytes:
+    return encode_jpeg(Image.new('RGB', (500, 500), (200, 40, 60)))
+
+
+def photo_artwork() -> bytes:
+    noise = Image.effect_noise((500, 500), 64).convert('RGB')
+    gradient = Image.linear_gradient('L').resize((500, 500)).convert('RGB')
+    return encode_jpeg(Image.blend(noise, gradient, 0.6).filter(ImageFilter.GaussianBlur(2)))
+
+
+def reference_cpu_ms(iterations: int) -> float:
+    source = Image.effect_noise(REFERENCE_SIZE, 64).convert('RGB')
+    cpu_times = []
+    for _ in range(iterations):
+        cpu_start = time.process_time()
+        source.filter(ImageFilter.GaussianBlur(5)).save(BytesIO(), format='PNG')
+        cpu_times.append(time.process_time() - cpu_start)
+    return statistics.median(cpu_times) * 1000
+
+
+def top_tracks(title: str, author: str, artwork_url: str) -> list:
+    return [(f"{title} {i}", author, 100 - i, artwork_url if i == 1 else None) for i in range(1, 11)]
+
+
+def build_scenarios() -> dict:
+    solid = solid_artwork()
+    photo = photo_artwork()
+    return {
+        'music_solid': ('music', 'solid.jpg', solid, "Short title", "Artist"),
+        'music_photo': ('music', 'photo.jpg', photo, "Short title", "Artist"),
+        'music_missing': ('music', None, None, "Short title", "Artist"),
+        'music_cyrillic': ('music', 'photo.jpg', photo, LONG_CYRILLIC_TITLE, LONG_CYRILLIC_AUTHOR),
+        'top_photo': ('top', 'photo.jpg', photo, "Track", "Artist"),
+        'top_missing': ('top', None, None, "Track", "Artist"),
+        'top_cyrillic': ('top', 'photo.jpg', photo, LONG_CYRILLIC_TITLE, LONG_CYRILLIC_AUTHOR),
+    }
+
+
+def render_once(renderer: BannerRenderer, scenario: tuple) -> int:
+    kind, artwork_url, artwork_data, title, author = scenario
+    if kind == 'music':
+        image = renderer.render_music_banner(artwork_url, artwork_data, title, author, 215000, "Слушатель")
+        name = 'music_banner'
+    else:
+        image = renderer.render_top_banner(top_tracks(title, author, artwork_url), "Тестовый сервер", artwork_data)
+        name = 'top_tracks'
+    data, _ = renderer.encode(image, name)
+    return len(data.getvalue())
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_scenario(scenario: tuple, iterations: int, warm: bool, image_format: str) -> dict:
+    renderer = BannerRenderer(image_format=image_format)
+    render_once(renderer, scenario)
+
+    wall_times = []
+    cpu_times = []
+    sizes = []
+    tracemalloc.start()
+    for _ in range(iterations):
+        if not warm:
+            renderer.clear()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        sizes.append(render_once(renderer, scenario))
+        cpu_times.append(time.process_time() - cpu_start)
+        wall_times.append(time.perf_counter() - wall_start)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'wall_p50_ms': round(statistics.median(wall_times) * 1000, 3),
+        'wall_p99_ms': round(percentile(wall_times, 0.99) * 1000, 3),
+        'cpu_ms': round(statistics.median(cpu_times) * 1000, 3),
+        'peak_py_kb': round(peak / 1024, 1),
+        'bytes': max(sizes),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in COMPARED_METRICS:
+            old = reference.get(metric)
+            new = metrics.get(metric)
+            if old and new > old * (1 + tolerance):
+                regressions.append(f"{name}.{metric}: {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for music and top banners")
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--format', default='WEBP', help="PNG, PNG8, WEBP or JPEG")
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative growth, 0.25 = +25%%")
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--only', nargs='*', help="run only these scenarios")
+    args = parser.parse_args()
+
+    scenarios = build_scenarios()
+    if args.only:
+        scenarios = {name: scenarios[name] for name in args.only}
+
+    results = {}
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    reference = reference_cpu_ms(args.iterations)
+    print(f"reference render: {reference:.2f} ms cpu")
+    print(f"{'scenario':<22} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms':>8} {'cpu/ref':>8} {'peak KB':>9} {'bytes':>8}")
+    for name, scenario in scenarios.items():
+        for warm in (False, True):
+            key = f"{name}_{'warm' if warm else 'cold'}"
+            metrics = run_scenario(scenario, args.iterations, warm, args.format)
+            metrics['cpu_ratio'] = round(metrics['cpu_ms'] / reference, 3)
+            results[key] = metrics
+            print(f"{key:<22} {metrics['wall_p50_ms']:>8.2f} {metrics['wall_p99_ms']:>8.2f} "
+                  f"{metrics['cpu_ms']:>8.2f} {metrics['cpu_ratio']:>8.3f} {metrics['peak_py_kb']:>9.1f} {metrics['bytes']:>8}")
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_start
+    print(f"max RSS growth: {rss_growth} KB")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+        print(f"baseline saved to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print("no baseline found, run with --save-baseline to create one")
+        return
+
+    regressions = compare(results, json.loads(args.baseline.read_text(encoding='utf-8')), args.tolerance)
+    if regressions:
+        print("regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"no regressions (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import base64
+import json
+import statistics
+import time
+from io import BytesIO
+
+from aiohttp import WSMsgType, web
+from PIL import Image, ImageFilter
+
+PASSWORD = 'youshallnotpass'
+ARTWORK_VARIANTS = 8
+PLAYLIST_SIZE = 10
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def make_artwork(seed: int) -> bytes:
+    noise = Image.effect_noise((500, 500), 40 + seed * 5).convert('RGB')
+    tint = Image.new('RGB', (500, 500), ((seed * 70) % 256, (seed * 130) % 256, (seed * 190) % 256))
+    image = Image.blend(noise, tint, 0.5).filter(ImageFilter.GaussianBlur(2))
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class FakePlayer:
+    __slots__ = ('guild_id', 'track', 'started_at', 'paused', 'volume', 'connected', 'end_task', 'ended_at')
+
+    def __init__(self, guild_id: str):
+        self.guild_id = guild_id
+        self.track = None
+        self.started_at = 0.0
+        self.paused = False
+        self.volume = 100
+        self.connected = False
+        self.end_task = None
+        self.ended_at = None
+
+    def position(self) -> int:
+        if not self.track:
+            return 0
+        return min(int((time.monotonic() - self.started_at) * 1000), self.track['info']['length'])
+
+    def payload(self) -> dict:
+        return {
+            'guildId': self.guild_id,
+            'track': self.track,
+            'volume': self.volume,
+            'paused': self.paused,
+            'state': {
+                'time': int(time.time() * 1000),
+                'position': self.position(),
+                'connected': self.connected,
+                'ping': 1
+            },
+            'voice': {'token': 'token', 'endpoint': 'sim.discord.media', 'sessionId': 'session'},
+            'filters': {}
+        }
+
+
+class FakeLavalink:
+    def __init__(self, track_length: float, update_interval: float, port: int):
+        self.track_length_ms = int(track_length * 1000)
+        self.update_interval = update_interval
+        self.port = port
+        self.session_id = 'fake-session'
+        self.players = {}
+        self.sockets = set()
+        self.artwork = [make_artwork(seed) for seed in range(ARTWORK_VARIANTS)]
+        self.counter = 0
+        self.requests = 0
+        self.track_starts = 0
+        self.natural_ends = 0
+        self.advance_latency = []
+        self.skip_latency = []
+        self.started_at = time.monotonic()
+
+    def make_track(self, query: str) -> dict:
+        self.counter += 1
+        number = self.counter
+        info = {
+            'identifier': f'fake-{number}',
+            'isSeekable': True,
+            'author': f'Artist {number % 50}',
+            'length': self.track_length_ms,
+            'isStream': False,
+            'position': 0,
+            'title': f'{query[:40]} #{number}',
+            'uri': f'https://soundcloud.example/track/{number}',
+            'artworkUrl': f'http://127.0.0.1:{self.port}/artwork/{number % ARTWORK_VARIANTS}.jpg',
+            'isrc': None,
+            'sourceName': 'soundcloud'
+        }
+        encoded = base64.b64encode(json.dumps(info).encode()).decode()
+        return {'encoded': encoded, 'info': info, 'pluginInfo': {}, 'userData': {}}
+
+    @staticmethod
+    def decode(encoded: str) -> dict:
+        info = json.loads(base64.b64decode(encoded))
+        return {'encoded': encoded, 'info': info, 'pluginInfo': {}, 'userData': {}}
+
+    async def broadcast(self, payload: dict):
+        data = json.dumps(payload)
+        for socket in list(self.sockets):
+            try:
+                await socket.send_str(data)
+            except ConnectionResetError:
+                self.sockets.discard(socket)
+
+    def player(self, guild_id: str) -> FakePlayer:
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = FakePlayer(guild_id)
+        return player
+
+    async def player_update(self, player: FakePlayer):
+        await self.broadcast({
+            'op': 'playerUpdate',
+            'guildId': player.guild_id,
+            'state': player.payload()['state']
+        })
+
+    async def end_track(self, player: FakePlayer, reason: str):
+        track, player.track = player.track, None
+        if player.end_task and player.end_task is not asyncio.current_task():
+            player.end_task.cancel()
+        player.end_task = None
+        if reason in ('finished', 'stopped'):
+            player.ended_at = (time.monotonic(), reason)
+        if reason == 'finished':
+            self.natural_ends += 1
+        await self.broadcast({
+            'op': 'event',
+            'type': 'TrackEndEvent',
+            'guildId': player.guild_id,
+            'track': track,
+            'reason': reason
+        })
+
+    async def finish_later(self, player: FakePlayer):
+        await asyncio.sleep(self.track_length_ms / 1000)
+        if player.track:
+            await self.end_track(player, 'finished')
+
+    async def start_track(self, player: FakePlayer, track: dict):
+        if player.track:
+            await self.end_track(player, 'replaced')
+        if player.ended_at:
+            ended, reason = player.ended_at
+            (self.advance_latency if reason == 'finished' else self.skip_latency).append(time.monotonic() - ended)
+            player.ended_at = None
+        player.track = track
+        player.started_at = time.monotonic()
+        self.track_starts += 1
+        player.end_task = asyncio.create_task(self.finish_later(player))
+        await self.broadcast({
+            'op': 'event',
+            'type': 'TrackStartEvent',
+            'guildId': player.guild_id,
+            'track': track
+        })
+
+    async def handle_version(self, request: web.Request) -> web.Response:
+        return web.Response(text='4.0.0')
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets.add(socket)
+        await socket.send_str(json.dumps({'op': 'ready', 'resumed': False, 'sessionId': self.session_id}))
+        async for message in socket:
+            if message.type == WSMsgType.ERROR:
+                break
+        self.sockets.discard(socket)
+        return socket
+
+    async def handle_load(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        identifier = request.query.get('identifier', '')
+        query = identifier.split(':', 1)[-1]
+        if 'playlist' in query:
+            return web.json_response({
+                'loadType': 'playlist',
+                'data': {
+                    'info': {'name': query, 'selectedTrack': -1},
+                    'pluginInfo': {},
+                    'tracks': [self.make_track(query) for _ in range(PLAYLIST_SIZE)]
+                }
+            })
+        return web.json_response({'loadType': 'search', 'data': [self.make_track(query) for _ in range(5)]})
+
+    async def handle_decode(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response(self.decode(request.query['encodedTrack']))
+
+    async def handle_decode_many(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response([self.decode(encoded) for encoded in await request.json()])
+
+    async def handle_session(self, request: web.Request) -> web.Response:
+        return web.json_response({'resuming': True, 'timeout': 60})
+
+    async def handle_players(self, request: web.Request) -> web.Response:
+        return web.json_response([player.payload() for player in self.players.values() if player.connected])
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        player = self.player(request.match_info['guild_id'])
+        body = await request.json()
+        no_replace = request.query.get('noReplace') == 'true'
+
+        if 'voice' in body and not player.connected:
+            player.connected = True
+            asyncio.create_task(self.player_update(player))
+        if 'volume' in body and body['volume'] is not None:
+            player.volume = body['volume']
+        if 'paused' in body and body['paused'] is not None:
+            player.paused = body['paused']
+        if 'encodedTrack' in body:
+            if body['encodedTrack'] is None:
+                if player.track:
+                    asyncio.create_task(self.end_track(player, 'stopped'))
+            elif not (no_replace and player.track):
+                await self.start_track(player, self.decode(body['encodedTrack']))
+        if body.get('position') and player.track:
+            player.started_at = time.monotonic() - body['position'] / 1000
+        return web.json_response(player.payload())
+
+    async def handle_destroy(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        player = self.players.pop(request.match_info['guild_id'], None)
+        if player and player.end_task:
+            player.end_task.cancel()
+        return web.Response(status=204)
+
+    async def handle_artwork(self, request: web.Request) -> web.Response:
+        index = int(request.match_info['index']) % ARTWORK_VARIANTS
+        return web.Response(body=self.artwork[index], content_type='image/jpeg')
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    def stats(self) -> dict:
+        return {
+            'uptime': round(time.monotonic() - self.started_at, 3),
+            'players': len(self.players),
+            'playing': sum(1 for player in self.players.values() if player.track),
+            'requests': self.requests,
+            'track_starts': self.track_starts,
+            'natural_ends': self.natural_ends,
+            'advance_count': len(self.advance_latency),
+            'advance_p50': percentile(self.advance_latency, 0.5),
+            'advance_p99': percentile(self.advance_latency, 0.99),
+            'advance_mean': statistics.mean(self.advance_latency) if self.advance_latency else 0.0,
+            'skip_count': len(self.skip_latency),
+            'skip_p50': percentile(self.skip_latency, 0.5),
+            'skip_p99': percentile(self.skip_latency, 0.99),
+        }
+
+    async def reset_stats(self, request: web.Request) -> web.Response:
+        self.advance_latency.clear()
+        self.skip_latency.clear()
+        return web.json_response(self.stats())
+
+    async def updates(self):
+        while True:
+            await asyncio.sleep(self.update_interval)
+            for player in list(self.players.values()):
+                if player.connected:
+                    await self.player_update(player)
+
+    @web.middleware
+    async def authorize(self, request: web.Request, handler):
+        if request.path.startswith('/artwork') or request.path.startswith('/_harness'):
+            return await handler(request)
+        if request.headers.get('Authorization') != PASSWORD:
+            return web.json_response({'status': 401, 'message': 'Unauthorized'}, status=401)
+        return await handler(request)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.authorize])
+        app.router.add_get('/version', self.handle_version)
+        app.router.add_get('/v4/websocket', self.handle_websocket)
+        app.router.add_get('/v4/loadtracks', self.handle_load)
+        app.router.add_get('/v4/decodetrack', self.handle_decode)
+        app.router.add_post('/v4/decodetracks', self.handle_decode_many)
+        app.router.add_patch('/v4/sessions/{session_id}', self.handle_session)
+        app.router.add_get('/v4/sessions/{session_id}/players', self.handle_players)
+        app.router.add_patch('/v4/sessions/{session_id}/players/{guild_id}', self.handle_update)
+        app.router.add_delete('/v4/sessions/{session_id}/players/{guild_id}', self.handle_destroy)
+        app.router.add_get('/artwork/{index}.jpg', self.handle_artwork)
+        app.router.add_get('/_harness/stats', self.handle_stats)
+        app.router.add_post('/_harness/reset', self.reset_stats)
+        return app
+
+
+async def serve(host: str, port: int, track_length: float, update_interval: float):
+    server = FakeLavalink(track_length, update_interval, port)
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"fake lavalink listening on http://{host}:{port}", flush=True)
+    try:
+        await server.updates()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in Lavalink v4 node for offline load tests")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7183)
+    parser.add_argument('--track-length', type=float, default=8.0, help="seconds per fake track")
+    parser.add_argument('--update-interval', type=float, default=5.0, help="seconds between playerUpdate ops")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.track_length, args.update_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,440 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import aiohttp
+import disnake
+import mafic
+from disnake.ext import commands
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from cogs.music import Music, MusicPlayer
+from utils.loopmonitor import LoopLagMonitor
+
+PASSWORD = 'youshallnotpass'
+ids = itertools.count(10_000_000)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def current_rss_kb() -> int:
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class DiscordStats:
+    def __init__(self):
+        self.sends = 0
+        self.edits = 0
+        self.deletes = 0
+        self.responses = []
+
+    def reset(self):
+        self.sends = self.edits = self.deletes = 0
+        self.responses = []
+
+
+class FakeMessage:
+    def __init__(self, channel: 'FakeTextChannel', message_id: int = None):
+        self.id = message_id or next(ids)
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        await self.channel.roundtrip()
+        self.channel.stats.edits += 1
+        return self
+
+    async def delete(self):
+        await self.channel.roundtrip()
+        self.channel.stats.deletes += 1
+
+
+class FakeTextChannel:
+    def __init__(self, stats: DiscordStats, latency: float):
+        self.id = next(ids)
+        self.mention = f'<#{self.id}>'
+        self.stats = stats
+        self.latency = latency
+
+    async def roundtrip(self):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def permissions_for(self, _):
+        return disnake.Permissions.all()
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self, message_id)
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        await self.roundtrip()
+        self.stats.sends += 1
+        return FakeMessage(self)
+
+
+class SimulatedVoiceChannel(disnake.VoiceChannel):
+    def permissions_for(self, *_, **__):
+        return disnake.Permissions.all()
+
+
+class FakeResponse:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+        self.done = False
+
+    def is_done(self) -> bool:
+        return self.done
+
+    async def _respond(self):
+        await self.interaction.channel.roundtrip()
+        self.done = True
+        self.interaction.responded()
+
+    async def defer(self, *args, **kwargs):
+        await self._respond()
+
+    async def send_message(self, *args, **kwargs):
+        await self._respond()
+
+    async def edit_message(self, *args, **kwargs):
+        await self._respond()
+
+
+class FakeFollowup:
+    def __init__(self, interaction: 'FakeInteraction'):
+        self.interaction = interaction
+
+    async def send(self, *args, **kwargs) -> FakeMessage:
+        return await self.interaction.channel.send()
+
+
+class FakeInteraction:
+    def __init__(self, guild: disnake.Guild, channel: FakeTextChannel, author):
+        self.id = next(ids)
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.created = time.monotonic()
+        self._responded = False
+
+    def responded(self):
+        if not self._responded:
+            self._responded = True
+            self.channel.stats.responses.append(time.monotonic() - self.created)
+
+    async def edit_original_response(self, *args, **kwargs) -> FakeMessage:
+        await self.channel.roundtrip()
+        self.responded()
+        return FakeMessage(self.channel)
+
+    async def original_message(self) -> FakeMessage:
+        return FakeMessage(self.channel)
+
+
+class FakeGateway:
+    def __init__(self, bot: commands.InteractionBot):
+        self.bot = bot
+
+    async def voice_state(self, guild_id: int, channel_id, self_mute: bool = False, self_deaf: bool = False):
+        if channel_id is None:
+            return
+        asyncio.create_task(self._handshake(int(guild_id), int(channel_id)))
+
+    async def _handshake(self, guild_id: int, channel_id: int):
+        await asyncio.sleep(0.01)
+        player = self.bot._connection._get_voice_client(guild_id)
+        if player is None:
+            return
+        await player.on_voice_state_update({
+            'guild_id': str(guild_id),
+            'channel_id': str(channel_id),
+            'session_id': f'session-{guild_id}',
+            'user_id': str(self.bot.user.id)
+        })
+        await player.on_voice_server_update({
+            'guild_id': str(guild_id),
+            'endpoint': 'sim.discord.media',
+            'token': 'token'
+        })
+
+
+class SimulatedBot(commands.InteractionBot):
+    def __init__(self):
+        super().__init__(command_sync_flags=commands.CommandSyncFlags.none())
+        self.mafic_ready = False
+        self.node = None
+        self.pool = mafic.NodePool(self)
+        self.gateway = FakeGateway(self)
+        self._connection.user = SimpleNamespace(id=next(ids), name='harness', mention='<@harness>')
+        self._connection._get_websocket = lambda *args, **kwargs: self.gateway
+
+
+class SimulatedGuild:
+    def __init__(self, bot: SimulatedBot, stats: DiscordStats, latency: float):
+        guild_id = next(ids)
+        self.guild = disnake.Guild(
+            data={'id': str(guild_id), 'name': f'Guild {guild_id}', 'roles': [], 'emojis': [], 'features': []},
+            state=bot._connection
+        )
+        self.voice = SimulatedVoiceChannel(
+            state=bot._connection,
+            guild=self.guild,
+            data={
+                'id': str(next(ids)), 'name': 'voice', 'type': 2, 'position': 0,
+                'guild_id': str(guild_id), 'permission_overwrites': [], 'bitrate': 64000, 'user_limit': 0
+            }
+        )
+        self.guild._add_channel(self.voice)
+        self.text = FakeTextChannel(stats, latency)
+        self.users = [
+            SimpleNamespace(
+                id=next(ids), display_name=f'user{i}', mention=f'<@user{i}>',
+                voice=SimpleNamespace(channel=self.voice)
+            )
+            for i in range(4)
+        ]
+        self.commands = 0
+
+    def interaction(self, user=None) -> FakeInteraction:
+        user = user or self.users[self.commands % len(self.users)]
+        self.commands += 1
+        return FakeInteraction(self.guild, self.text, user)
+
+    @property
+    def player(self):
+        return self.guild.voice_client
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.stats = DiscordStats()
+        self.guilds = []
+        self.tasks = []
+        self.drivers = []
+        self.command_errors = 0
+        self.actions = {'play': 0, 'playlist': 0, 'skip': 0, 'loop': 0}
+
+    async def start(self, port: int):
+        self.bot = SimulatedBot()
+        self.bot._ready.set()
+        self.music = Music(self.bot)
+        self.bot.add_cog(self.music)
+        await asyncio.sleep(0)
+        self.bot.node = await self.bot.pool.create_node(
+            host='127.0.0.1', port=port, label='FAKE', password=PASSWORD
+        )
+        self.bot.mafic_ready = True
+        self.monitor = LoopLagMonitor(interval=0.05, threshold=self.args.lag_threshold)
+        self.monitor.start()
+        self.port = port
+
+    async def command(self, coro):
+        try:
+            await coro
+        except Exception as e:
+            self.command_errors += 1
+            logging.getLogger('harness').warning(f"command failed: {e!r}")
+
+    def run_command(self, coro):
+        task = asyncio.create_task(self.command(coro))
+        self.tasks.append(task)
+        task.add_done_callback(self.tasks.remove)
+
+    def play(self, guild: SimulatedGuild, playlist: bool = False):
+        self.actions['playlist' if playlist else 'play'] += 1
+        query = f"{'playlist' if playlist else 'song'} {random.randint(1, 10_000)}"
+        self.run_command(self.music.play(guild.interaction(), query))
+
+    def control(self, guild: SimulatedGuild, name: str):
+        player = guild.player
+        if not player or not player.last_user_id:
+            return
+        user = next((user for user in guild.users if user.id == player.last_user_id), guild.users[0])
+        self.actions[name] += 1
+        self.run_command(getattr(self.music.controls, f'_{name}')(guild.interaction(user)))
+
+    async def drive(self, guild: SimulatedGuild):
+        self.play(guild)
+        while True:
+            await asyncio.sleep(random.expovariate(1 / self.args.action_interval))
+            roll = random.random()
+            player = guild.player
+            if player is None or not player.current_track:
+                self.play(guild)
+            elif roll < 0.35:
+                self.play(guild)
+            elif roll < 0.5:
+                self.play(guild, playlist=True)
+            elif roll < 0.8 and player.queue:
+                self.control(guild, 'skip')
+            else:
+                self.control(guild, 'loop')
+
+    async def add_guilds(self, count: int):
+        for _ in range(count):
+            guild = SimulatedGuild(self.bot, self.stats, self.args.discord_latency)
+            self.guilds.append(guild)
+            self.drivers.append(asyncio.create_task(self.drive(guild)))
+            await asyncio.sleep(self.args.ramp_delay)
+
+    async def lavalink(self, session: aiohttp.ClientSession, path: str, method: str = 'GET') -> dict:
+        async with session.request(method, f'http://127.0.0.1:{self.port}/_harness/{path}') as response:
+            return await response.json()
+
+    async def step(self, session: aiohttp.ClientSession, target: int) -> dict:
+        await self.add_guilds(target - len(self.guilds))
+        await self.lavalink(session, 'reset', 'POST')
+        self.stats.reset()
+        self.monitor.samples.clear()
+        for key in self.actions:
+            self.actions[key] = 0
+        before = await self.lavalink(session, 'stats')
+        cpu_start = time.process_time()
+        started = time.monotonic()
+
+        await asyncio.sleep(self.args.duration)
+
+        elapsed = time.monotonic() - started
+        after = await self.lavalink(session, 'stats')
+        lag = self.monitor.percentiles()
+        players = [guild.player for guild in self.guilds if guild.player]
+        return {
+            'guilds': len(self.guilds),
+            'players': len(players),
+            'queued': sum(len(player.queue) for player in players if isinstance(player, MusicPlayer)),
+            'commands_per_s': round(sum(self.actions.values()) / elapsed, 2),
+            'tracks_per_s': round((after['track_starts'] - before['track_starts']) / elapsed, 2),
+            'response_p50_ms': round(percentile(self.stats.responses, 0.5) * 1000, 1),
+            'response_p99_ms': round(percentile(self.stats.responses, 0.99) * 1000, 1),
+            'advance_p50_ms': round(after['advance_p50'] * 1000, 1),
+            'advance_p99_ms': round(after['advance_p99'] * 1000, 1),
+            'skip_p50_ms': round(after['skip_p50'] * 1000, 1),
+            'lag_p50_ms': round(lag['p50'] * 1000, 2),
+            'lag_p99_ms': round(lag['p99'] * 1000, 2),
+            'lag_max_ms': round(lag['max'] * 1000, 2),
+            'cpu_pct': round((time.process_time() - cpu_start) / elapsed * 100, 1),
+            'rss_mb': round(current_rss_kb() / 1024, 1),
+            'discord_sends': self.stats.sends,
+            'discord_edits': self.stats.edits,
+            'dispatcher_depth': self.music.dispatcher.stats()['queue_depth'],
+            'errors': self.command_errors,
+            'actions': dict(self.actions),
+        }
+
+    async def stop(self):
+        self.monitor.stop()
+        for task in self.drivers + self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.drivers, *self.tasks, return_exceptions=True)
+        for guild in self.guilds:
+            if guild.player:
+                try:
+                    await guild.player.disconnect(force=True)
+                except Exception:
+                    pass
+        self.bot.remove_cog('Music')
+        await self.bot.node.close()
+        await asyncio.sleep(0.1)
+
+
+COLUMNS = (
+    ('guilds', 7), ('players', 8), ('commands_per_s', 8), ('tracks_per_s', 8),
+    ('response_p99_ms', 10), ('advance_p50_ms', 10), ('advance_p99_ms', 10),
+    ('lag_p50_ms', 9), ('lag_p99_ms', 9), ('lag_max_ms', 9), ('cpu_pct', 7), ('rss_mb', 8), ('errors', 7)
+)
+
+
+async def run(args):
+    port = args.port or free_port()
+    server = None
+    if not args.port:
+        server = subprocess.Popen([
+            sys.executable, str(Path(__file__).resolve().parent / 'fake_lavalink.py'),
+            '--port', str(port),
+            '--track-length', str(args.track_length),
+            '--update-interval', str(args.update_interval)
+        ], stdout=subprocess.DEVNULL)
+
+    harness = Harness(args)
+    results = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for _ in range(100):
+                try:
+                    async with session.get(f'http://127.0.0.1:{port}/version'):
+                        break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.1)
+
+            await harness.start(port)
+            print(' '.join(f'{name:>{width}}' for name, width in COLUMNS), flush=True)
+            for target in args.guilds:
+                result = await harness.step(session, target)
+                results.append(result)
+                print(' '.join(f'{result[name]:>{width}}' for name, width in COLUMNS), flush=True)
+        await harness.stop()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + '\n', encoding='utf-8')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the Music cog against a fake Lavalink node with N simulated guilds")
+    parser.add_argument('--guilds', type=int, nargs='+', default=[10, 50, 100], help="guild counts to step through")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds measured per step")
+    parser.add_argument('--track-length', type=float, default=8.0)
+    parser.add_argument('--update-interval', type=float, default=5.0, help="fake playerUpdate period")
+    parser.add_argument('--action-interval', type=float, default=6.0, help="mean seconds between actions per guild")
+    parser.add_argument('--discord-latency', type=float, default=0.05, help="simulated Discord API round trip")
+    parser.add_argument('--ramp-delay', type=float, default=0.02, help="delay between adding guilds")
+    parser.add_argument('--lag-threshold', type=float, default=0.25)
+    parser.add_argument('--port', type=int, help="use an already running fake_lavalink.py on this port")
+    parser.add_argument('--output', help="write results as JSON")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
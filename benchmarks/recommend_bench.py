@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config
+from utils.recommend import RecommendationEngine
+
+GUILD_ID = 1
+START = datetime(2024, 1, 1)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class SyntheticHistory:
+    def __init__(self, users: int, tracks: int, genres: int, seed: int):
+        self.random = random.Random(seed)
+        self.genres = genres
+        self.tracks = [(f"Track {i}", f"Artist {i // 10}") for i in range(tracks)]
+        self.by_genre = [list(range(genre, tracks, genres)) for genre in range(genres)]
+        self.tastes = [self.random.sample(range(genres), 2) for _ in range(users)]
+        self.clock = [START + timedelta(seconds=self.random.randint(0, 86400)) for _ in range(users)]
+
+    def genre_of(self, title: str) -> int:
+        return int(title.rsplit(' ', 1)[1]) % self.genres
+
+    def pick(self, genre: int) -> int:
+        pool = self.by_genre[genre]
+        return pool[int(len(pool) * self.random.random() ** 3)]
+
+    def rows(self, count: int):
+        produced = 0
+        while produced < count:
+            user = self.random.randrange(len(self.tastes))
+            genre = self.random.choice(self.tastes[user])
+            when = self.clock[user] + timedelta(hours=self.random.uniform(2, 30))
+            for _ in range(self.random.randint(5, 30)):
+                if produced >= count:
+                    break
+                title, author = self.tracks[self.pick(genre)]
+                when += timedelta(seconds=self.random.randint(120, 300))
+                yield title, author, user, GUILD_ID, when.strftime('%Y-%m-%d %H:%M:%S')
+                produced += 1
+            self.clock[user] = when
+
+
+def fill(db_path: str, history: SyntheticHistory, count: int) -> float:
+    started = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        'INSERT INTO track_history (track_title, track_author, user_id, guild_id, played_at) VALUES (?, ?, ?, ?, ?)',
+        history.rows(count)
+    )
+    conn.commit()
+    conn.close()
+    return time.perf_counter() - started
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(args) -> dict:
+    from cogs.music import MusicDatabase
+
+    history = SyntheticHistory(args.users, args.tracks, args.genres, args.seed)
+    db = MusicDatabase()
+    insert_seconds = fill(config.DB_PATH, history, args.rows)
+    engine = RecommendationEngine(db)
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    index = await engine.ensure(GUILD_ID)
+    build_seconds = time.perf_counter() - started
+    stats = index.stats()
+
+    fill(config.DB_PATH, history, args.increment)
+    db.history_versions[GUILD_ID] = db.get_history_version(GUILD_ID) + 1
+    started = time.perf_counter()
+    await engine.ensure(GUILD_ID)
+    increment_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.seed + 1)
+    labels = index.labels
+    cold, warm, mixes = [], [], []
+    for _ in range(args.queries):
+        title, author = labels[rng.randrange(len(labels))]
+        started = time.perf_counter()
+        index.similar_to(title, author, 25)
+        cold.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        index.similar_to(title, author, 25)
+        warm.append(time.perf_counter() - started)
+
+    hits = total = 0
+    for _ in range(args.queries):
+        user = rng.randrange(args.users)
+        genre = rng.choice(history.tastes[user])
+        seeds = [history.tracks[history.pick(genre)] for _ in range(20)]
+        started = time.perf_counter()
+        recommended = index.recommend(seeds, 40, exclude=seeds)
+        mixes.append(time.perf_counter() - started)
+        hits += sum(1 for title, _ in recommended if history.genre_of(title) == genre)
+        total += len(recommended)
+
+    return {
+        'rows': stats['rows'],
+        'items': stats['items'],
+        'pairs': stats['pairs'],
+        'insert_s': round(insert_seconds, 2),
+        'build_s': round(build_seconds, 2),
+        'build_rows_per_s': int(stats['rows'] / build_seconds) if build_seconds else 0,
+        'increment_rows': args.increment,
+        'increment_ms': round(increment_seconds * 1000, 1),
+        'similar_cold_p50_ms': round(percentile(cold, 0.5) * 1000, 3),
+        'similar_cold_p99_ms': round(percentile(cold, 0.99) * 1000, 3),
+        'similar_warm_p99_ms': round(percentile(warm, 0.99) * 1000, 4),
+        'mix_p50_ms': round(percentile(mixes, 0.5) * 1000, 3),
+        'mix_p99_ms': round(percentile(mixes, 0.99) * 1000, 3),
+        'genre_precision': round(hits / total, 3) if total else 0.0,
+        'index_rss_mb': round(rss_mb() - rss_before, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the track_history recommendation index")
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--increment', type=int, default=10_000, help="rows appended after the cold build")
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--tracks', type=int, default=50_000)
+    parser.add_argument('--genres', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=1_000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        config.DB_PATH = os.path.join(directory, 'history.db')
+        result = asyncio.run(run(args))
+
+    width = max(map(len, result))
+    for name, value in result.items():
+        print(f"{name:<{width}}  {value}")
+    if args.output:
+        args.output.write_text(json.dumps(result, indent=2) + '\n', encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
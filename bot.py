@@ -1,98 +1,179 @@
-import disnake
-from disnake.ext import commands
-import os
-import logging
-import asyncio
-import mafic
-from dotenv import load_dotenv
-from cogs.music import Music
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
-
-logger = logging.getLogger('bot')
-
-load_dotenv()
-
-class MusicBot(commands.InteractionBot):
-    def __init__(self):
-        intents = disnake.Intents.default()
-        intents.message_content = True
-        intents.voice_states = True
-        super().__init__(intents=intents)
-        self.mafic_ready = False
-        self.node = None
-        self.pool = mafic.NodePool(self)
-        logger.info("Bot initialized")
-
-    async def load_initial_cogs(self):
-        logger.info("Loading initial cogs...")
-        try:
-            if "cogs.music" not in self.extensions:
-                logger.info("Loading Music cog...")
-                self.load_extension("cogs.music")
-                logger.info("Music cog loaded successfully")
-            else:
-                logger.info("Music cog already loaded")
-            try:
-                logger.info("Connecting to Lavalink...")
-                await self.pool.create_node(
-                    host="127.0.0.1",
-                    port=7183,
-                    password="youshallnotpass",
-                    label="MAIN"
-                )
-                logger.info("Successfully connected to Lavalink")
-            except Exception as e:
-                logger.error(f"Failed to connect to Lavalink: {e}")
-                raise
-                
-        except Exception as e:
-            logger.error(f"Error loading cogs: {e}")
-            raise
-
-    async def on_ready(self):
-        logger.info(f"Logged in as {self.user} (ID: {self.user.id})")
-        logger.info("------")
-        await self.load_initial_cogs()
-
-    async def on_error(self, event_method: str, *args, **kwargs):
-        logger.error(f"Error in {event_method}:", exc_info=True)
-
-    @commands.slash_command()
-    async def ping(self, inter: disnake.ApplicationCommandInteraction):
-        await inter.response.send_message(f"Pong! Latency: {round(self.latency * 1000)}ms")
-
-    @commands.slash_command()
-    async def reload(self, inter: disnake.ApplicationCommandInteraction):
-        if inter.author.id != 1193877999465025586:   
-            return await inter.response.send_message("❌ You don't have permission to use this command!", ephemeral=True)
-            
-        try:
-            self.unload_extension("cogs.music")
-            self.load_extension("cogs.music")
-            await inter.response.send_message("✅ Music cog reloaded!", ephemeral=True)
-        except Exception as e:
-            await inter.response.send_message(f"❌ Error reloading music cog: {e}", ephemeral=True)
-
-def main():
-    try:
-        token = os.getenv('TOKEN')
-        if not token:
-            logger.error("No token found in .env file!")
-            return
-            
-        bot = MusicBot()
-        bot.run(token)
-        
-    except Exception as e:
-        logger.error(f"Error starting bot: {e}")
-
-if __name__ == "__main__":
+import disnake
+from disnake.ext import commands
+import os
+import logging
+import asyncio
+import mafic
+import time
+from dotenv import load_dotenv
+import config
+from utils.cluster import ClusterInfo
+from utils.logsetup import setup_logging
+from cogs.music import Music
+from utils.loopmonitor import LoopLagMonitor
+from utils.metrics import REGISTRY, COMMAND_LATENCY, process_rss_bytes
+from utils.profiler import SamplingProfiler
+
+CLUSTER = ClusterInfo.from_env()
+
+setup_logging(CLUSTER.log_file)
+
+logger = logging.getLogger('bot')
+
+load_dotenv()
+
+def cache_profile(profile: str = config.CACHE_PROFILE) -> dict:
+    if profile != 'lean':
+        intents = disnake.Intents.default()
+        intents.message_content = True
+        intents.voice_states = True
+        return {'intents': intents}
+
+    intents = disnake.Intents.none()
+    intents.guilds = True
+    intents.voice_states = True
+    return {
+        'intents': intents,
+        'member_cache_flags': disnake.MemberCacheFlags(voice=True, joined=False),
+        'max_messages': None,
+        'chunk_guilds_at_startup': False
+    }
+
+class MusicBot(commands.AutoShardedInteractionBot):
+    def __init__(self, cluster: ClusterInfo = CLUSTER):
+        super().__init__(**cache_profile(), shard_ids=cluster.shard_ids, shard_count=cluster.shard_count)
+        self.cluster = cluster
+        self.mafic_ready = False
+        self.node = None
+        self.pool = mafic.NodePool(self)
+        self._command_started = {}
+        self.loop_monitor = LoopLagMonitor()
+        self.profiler = SamplingProfiler()
+        self.before_slash_command_invoke(self._start_command_timer)
+        self.after_slash_command_invoke(self._stop_command_timer)
+        self.load_extension("cogs.diagnostics")
+        logger.info(f"Bot initialized (cluster {cluster.cluster_id}, shards {cluster.shard_ids or 'auto'})")
+
+    async def _start_command_timer(self, inter: disnake.ApplicationCommandInteraction):
+        self._command_started[inter.id] = time.perf_counter()
+
+    async def _stop_command_timer(self, inter: disnake.ApplicationCommandInteraction):
+        started = self._command_started.pop(inter.id, None)
+        if started is None:
+            return
+        status = 'error' if inter.command_failed else 'ok'
+        COMMAND_LATENCY.observe(
+            time.perf_counter() - started,
+            command=inter.application_command.qualified_name,
+            status=status
+        )
+
+    def memory_report(self) -> dict:
+        rss = process_rss_bytes()
+        guilds = len(self.guilds)
+        sessions = len(self.voice_clients)
+        return {
+            'rss': rss,
+            'guilds': guilds,
+            'voice_sessions': sessions,
+            'cached_members': sum(len(guild.members) for guild in self.guilds),
+            'rss_per_guild': rss // guilds if guilds else 0,
+            'rss_per_session': rss // sessions if sessions else 0
+        }
+
+    def register_memory_metrics(self):
+        REGISTRY.gauge('process_resident_memory_bytes', 'RSS процесса').set_function(process_rss_bytes)
+        REGISTRY.gauge('bot_guilds', 'Серверов в кэше').set_function(lambda: len(self.guilds))
+        REGISTRY.gauge('bot_voice_sessions', 'Активные голосовые подключения').set_function(
+            lambda: len(self.voice_clients)
+        )
+        REGISTRY.gauge('bot_cached_members', 'Участников в кэше').set_function(
+            lambda: sum(len(guild.members) for guild in self.guilds)
+        )
+        REGISTRY.gauge('bot_rss_per_guild_bytes', 'RSS на один сервер').set_function(
+            lambda: self.memory_report()['rss_per_guild']
+        )
+
+    async def start_metrics(self):
+        self.register_memory_metrics()
+        if not config.METRICS_PORT:
+            return
+        try:
+            await REGISTRY.start_server(config.METRICS_HOST, self.cluster.metrics_port)
+        except OSError as e:
+            logger.error(f"Failed to start metrics endpoint: {e}")
+
+    async def load_initial_cogs(self):
+        logger.info("Loading initial cogs...")
+        try:
+            if "cogs.music" not in self.extensions:
+                logger.info("Loading Music cog...")
+                self.load_extension("cogs.music")
+                logger.info("Music cog loaded successfully")
+            else:
+                logger.info("Music cog already loaded")
+            if self.pool.nodes:
+                return
+            try:
+                node = self.cluster.lavalink_node
+                logger.info(f"Connecting to Lavalink {node['label']} at {node['host']}:{node['port']}...")
+                self.node = await self.pool.create_node(**node)
+                logger.info("Successfully connected to Lavalink")
+                music = self.get_cog("Music")
+                if music:
+                    await music.restore_players()
+            except Exception as e:
+                logger.error(f"Failed to connect to Lavalink: {e}")
+                raise
+                
+        except Exception as e:
+            logger.error(f"Error loading cogs: {e}")
+            raise
+
+    async def on_ready(self):
+        logger.info(f"Logged in as {self.user} (ID: {self.user.id}) | Shards: {sorted(self.shards)}")
+        logger.info("------")
+        self.loop_monitor.start()
+        await self.start_metrics()
+        await self.load_initial_cogs()
+        report = self.memory_report()
+        logger.info(
+            f"Cache profile {config.CACHE_PROFILE}: RSS {report['rss'] / 1048576:.1f} MB | "
+            f"Guilds: {report['guilds']} | Cached members: {report['cached_members']} | "
+            f"RSS per guild: {report['rss_per_guild'] / 1024:.1f} KB"
+        )
+
+    async def on_error(self, event_method: str, *args, **kwargs):
+        logger.error(f"Error in {event_method}:", exc_info=True)
+
+    @commands.slash_command()
+    async def ping(self, inter: disnake.ApplicationCommandInteraction):
+        await inter.response.send_message(f"Pong! Latency: {round(self.latency * 1000)}ms")
+
+    @commands.slash_command()
+    async def reload(self, inter: disnake.ApplicationCommandInteraction):
+        if inter.author.id != config.OWNER_ID:
+            return await inter.response.send_message("❌ You don't have permission to use this command!", ephemeral=True)
+            
+        try:
+            self.unload_extension("cogs.music")
+            self.load_extension("cogs.music")
+            await inter.response.send_message("✅ Music cog reloaded!", ephemeral=True)
+        except Exception as e:
+            await inter.response.send_message(f"❌ Error reloading music cog: {e}", ephemeral=True)
+
+def main():
+    try:
+        token = os.getenv('TOKEN')
+        if not token:
+            logger.error("No token found in .env file!")
+            return
+            
+        bot = MusicBot()
+        bot.run(token)
+        
+    except Exception as e:
+        logger.error(f"Error starting bot: {e}")
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
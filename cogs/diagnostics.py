@@ -0,0 +1,45 @@
+import time
+from io import BytesIO
+
+import disnake
+from disnake.ext import commands
+
+import config
+
+
+class Diagnostics(commands.Cog):
+    def __init__(self, bot: commands.InteractionBot):
+        self.bot = bot
+
+    @commands.slash_command()
+    async def profile(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        action: str = commands.Param(choices=["start", "stop"])
+    ):
+        if inter.author.id != config.OWNER_ID:
+            return await inter.response.send_message("❌ You don't have permission to use this command!", ephemeral=True)
+
+        if action == "start":
+            if self.bot.profiler.running:
+                return await inter.response.send_message("⚠️ Profiler is already running!", ephemeral=True)
+            self.bot.profiler.start()
+            return await inter.response.send_message(
+                f"✅ Profiler started (stops automatically after {config.PROFILE_MAX_DURATION}s)", ephemeral=True
+            )
+
+        if not self.bot.profiler.pending:
+            return await inter.response.send_message("❌ Profiler is not running!", ephemeral=True)
+
+        data = self.bot.profiler.stop()
+        file = disnake.File(BytesIO(data), filename=f"profile_{int(time.time())}.folded")
+        await inter.response.send_message(
+            f"✅ {self.bot.profiler.samples} samples over {self.bot.profiler.duration:.1f}s "
+            f"(collapsed stacks, open with flamegraph.pl or speedscope)",
+            file=file,
+            ephemeral=True
+        )
+
+
+def setup(bot: commands.InteractionBot):
+    bot.add_cog(Diagnostics(bot))
@@ -5,26 +5,41 @@ import logging
 import asyncio
 import time
 from typing import Optional, List
-import aiohttp
+from collections import OrderedDict, deque
 from io import BytesIO
-from PIL import Image, ImageDraw, ImageFilter
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import sqlite3
 import os
 import json
 import random
 import traceback
+import re
+import config
+from utils.banners import BannerRenderer
+from utils.dispatcher import MessageDispatcher
+from utils.http import HttpClient
+from utils.playerstate import PlayerState, PlayerStateStore, create_backend
+from utils.recommend import RecommendationEngine, item_key
+from utils.autocomplete import AutocompleteIndex
+from utils.metrics import REGISTRY, BUTTON_LATENCY, DB_LATENCY, LAVALINK_LATENCY
 
 logger = logging.getLogger('music_cog')
 
+def channel_message(message):
+    if isinstance(message, disnake.InteractionMessage):
+        return message.channel.get_partial_message(message.id)
+    return message
+
 class MusicDatabase:
     def __init__(self):
-        self.db_path = 'music_history.db'
+        self.db_path = config.DB_PATH
+        self.history_versions = {}
         self._init_db()
 
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS track_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,6 +50,14 @@ class MusicDatabase:
                     played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            cursor.execute('PRAGMA table_info(track_history)')
+            columns = [row[1] for row in cursor.fetchall()]
+            if 'artwork_url' not in columns:
+                cursor.execute('ALTER TABLE track_history ADD COLUMN artwork_url TEXT')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_track_history_guild_id ON track_history (guild_id, id)')
+            cursor.execute('DROP INDEX IF EXISTS idx_track_history_user_id')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_track_history_user ON track_history (user_id, id)')
+            self.fts = self._init_fts(cursor)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS daily_mixes (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -45,46 +68,156 @@ class MusicDatabase:
                     UNIQUE(user_id, guild_id)
                 )
             ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS prepared_mixes (
+                    user_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    mix_date TEXT NOT NULL,
+                    tracks TEXT NOT NULL,
+                    encoded TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, guild_id, mix_date)
+                )
+            ''')
             conn.commit()
 
-    async def add_track(self, track_title: str, track_author: str, user_id: int, guild_id: int):
-        with sqlite3.connect(self.db_path) as conn:
+    def _init_fts(self, cursor: sqlite3.Cursor) -> bool:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'track_history_fts'")
+        exists = cursor.fetchone() is not None
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS track_history_fts USING fts5(
+                    track_title,
+                    track_author,
+                    content='track_history',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            logger.warning(f"[DB] FTS5 недоступен, поиск по истории будет выполняться через LIKE: {e}")
+            return False
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS track_history_fts_insert AFTER INSERT ON track_history BEGIN
+                INSERT INTO track_history_fts (rowid, track_title, track_author)
+                VALUES (new.id, new.track_title, new.track_author);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS track_history_fts_delete AFTER DELETE ON track_history BEGIN
+                INSERT INTO track_history_fts (track_history_fts, rowid, track_title, track_author)
+                VALUES ('delete', old.id, old.track_title, old.track_author);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS track_history_fts_update AFTER UPDATE ON track_history BEGIN
+                INSERT INTO track_history_fts (track_history_fts, rowid, track_title, track_author)
+                VALUES ('delete', old.id, old.track_title, old.track_author);
+                INSERT INTO track_history_fts (rowid, track_title, track_author)
+                VALUES (new.id, new.track_title, new.track_author);
+            END
+        ''')
+        if not exists:
+            cursor.execute("INSERT INTO track_history_fts (track_history_fts) VALUES ('rebuild')")
+            logger.info("[DB] Полнотекстовый индекс истории построен")
+        return True
+
+    @staticmethod
+    def fts_query(text: str) -> Optional[str]:
+        terms = re.findall(r'\w+', text)
+        return ' '.join(f'"{term}"*' for term in terms) if terms else None
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=config.DB_BUSY_TIMEOUT)
+
+    def get_history_version(self, guild_id: int) -> int:
+        return self.history_versions.get(guild_id, 0)
+
+    @DB_LATENCY.timed(method='add_track')
+    async def add_track(self, track_title: str, track_author: str, user_id: int, guild_id: int, artwork_url: str = None):
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO track_history (track_title, track_author, user_id, guild_id)
-                VALUES (?, ?, ?, ?)
-            ''', (track_title, track_author, user_id, guild_id))
+                INSERT INTO track_history (track_title, track_author, user_id, guild_id, artwork_url)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (track_title, track_author, user_id, guild_id, artwork_url))
             conn.commit()
+        self.history_versions[guild_id] = self.history_versions.get(guild_id, 0) + 1
 
+    @DB_LATENCY.timed(method='get_user_tracks')
     async def get_user_tracks(self, user_id: int, limit: int = 10):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT track_title, track_author, played_at
                 FROM track_history
                 WHERE user_id = ?
-                ORDER BY played_at DESC
+                ORDER BY id DESC
                 LIMIT ?
             ''', (user_id, limit))
             return cursor.fetchall()
 
+    @DB_LATENCY.timed(method='get_guild_tracks')
     async def get_guild_tracks(self, guild_id: int, limit: int = 10):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT track_title, track_author, user_id, played_at
                 FROM track_history
                 WHERE guild_id = ?
-                ORDER BY played_at DESC
+                ORDER BY id DESC
                 LIMIT ?
             ''', (guild_id, limit))
             return cursor.fetchall()
 
+    @DB_LATENCY.timed(method='get_history_page')
+    async def get_history_page(
+        self,
+        guild_id: int,
+        user_id: Optional[int] = None,
+        search: Optional[str] = None,
+        before_id: Optional[int] = None,
+        limit: int = 10
+    ) -> list:
+        conditions = ['h.guild_id = ?']
+        params = [guild_id]
+        source = 'track_history h'
+        order = 'h.id'
+        if user_id:
+            conditions.append('h.user_id = ?')
+            params.append(user_id)
+        match = self.fts_query(search) if search else None
+        if match and self.fts:
+            source = 'track_history_fts f JOIN track_history h ON h.id = f.rowid'
+            order = 'f.rowid'
+            conditions.append('track_history_fts MATCH ?')
+            params.append(match)
+        elif search:
+            pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            conditions.append("(h.track_title LIKE ? ESCAPE '\\' OR h.track_author LIKE ? ESCAPE '\\')")
+            params.extend((pattern, pattern))
+        if before_id:
+            conditions.append(f'{order} < ?')
+            params.append(before_id)
+        params.append(limit)
+
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT h.id, h.track_title, h.track_author, h.user_id, h.played_at
+                FROM {source}
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order} DESC
+                LIMIT ?
+            ''', params)
+            return cursor.fetchall()
+
+    @DB_LATENCY.timed(method='get_most_played_tracks')
     async def get_most_played_tracks(self, guild_id: int, limit: int = 10):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT track_title, track_author, COUNT(*) as play_count
+                SELECT track_title, track_author, COUNT(*) as play_count, MAX(artwork_url) as artwork_url
                 FROM track_history
                 WHERE guild_id = ?
                 GROUP BY track_title, track_author
@@ -93,8 +226,28 @@ class MusicDatabase:
             ''', (guild_id, limit))
             return cursor.fetchall()
 
+    @DB_LATENCY.timed(method='get_recent_popular_tracks')
+    async def get_recent_popular_tracks(self, guild_id: int, rows: int, limit: int) -> list:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT track_title, track_author, COUNT(*) as play_count, MAX(artwork_url) as artwork_url
+                FROM (
+                    SELECT track_title, track_author, artwork_url
+                    FROM track_history
+                    WHERE guild_id = ?
+                    ORDER BY id DESC
+                    LIMIT ?
+                )
+                GROUP BY track_title, track_author
+                ORDER BY play_count DESC
+                LIMIT ?
+            ''', (guild_id, rows, limit))
+            return cursor.fetchall()
+
+    @DB_LATENCY.timed(method='get_user_unique_tracks')
     async def get_user_unique_tracks(self, user_id: int, guild_id: int, limit: int = 100) -> list:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT DISTINCT track_title, track_author
@@ -105,8 +258,51 @@ class MusicDatabase:
             ''', (user_id, guild_id, limit))
             return cursor.fetchall()
 
+    @DB_LATENCY.timed(method='get_history_since')
+    async def get_history_since(self, guild_id: int, after_id: int, limit: int) -> list:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, CAST(strftime('%s', played_at) AS INTEGER), track_title, track_author
+                FROM track_history
+                WHERE guild_id = ? AND id > ?
+                ORDER BY id
+                LIMIT ?
+            ''', (guild_id, after_id, limit))
+            return cursor.fetchall()
+
+    @DB_LATENCY.timed(method='get_radio_candidates')
+    async def get_radio_candidates(self, guild_id: int, track_title: str, track_author: str, limit: int = 25) -> list:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT track_title, track_author, COUNT(*) as play_count
+                FROM track_history
+                WHERE guild_id = ?
+                  AND user_id IN (
+                      SELECT DISTINCT user_id
+                      FROM track_history
+                      WHERE guild_id = ? AND track_title = ? AND track_author IS ?
+                  )
+                  AND NOT (track_title = ? AND track_author IS ?)
+                GROUP BY track_title, track_author
+                ORDER BY play_count DESC
+                LIMIT ?
+            ''', (guild_id, guild_id, track_title, track_author, track_title, track_author, limit))
+            co_listened = cursor.fetchall()
+            cursor.execute('''
+                SELECT track_title, track_author, COUNT(*) as play_count
+                FROM track_history
+                WHERE guild_id = ?
+                GROUP BY track_title, track_author
+                ORDER BY play_count DESC
+                LIMIT ?
+            ''', (guild_id, limit))
+            return co_listened + cursor.fetchall()
+
+    @DB_LATENCY.timed(method='save_daily_mix')
     async def save_daily_mix(self, user_id: int, guild_id: int, tracks: list):
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             tracks_json = json.dumps(tracks)
             cursor.execute('''
@@ -115,8 +311,68 @@ class MusicDatabase:
             ''', (user_id, guild_id, tracks_json))
             conn.commit()
 
+    @DB_LATENCY.timed(method='get_active_listeners')
+    async def get_active_listeners(self, days: int) -> list:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, guild_id
+                FROM track_history
+                WHERE played_at >= datetime('now', ?)
+                GROUP BY user_id, guild_id
+                ORDER BY MAX(played_at) DESC
+            ''', (f'-{days} days',))
+            return cursor.fetchall()
+
+    @DB_LATENCY.timed(method='has_prepared_mix')
+    async def has_prepared_mix(self, user_id: int, guild_id: int, mix_date: str) -> bool:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT 1 FROM prepared_mixes
+                WHERE user_id = ? AND guild_id = ? AND mix_date = ?
+            ''', (user_id, guild_id, mix_date))
+            return cursor.fetchone() is not None
+
+    @DB_LATENCY.timed(method='save_prepared_mix')
+    async def save_prepared_mix(self, user_id: int, guild_id: int, mix_date: str, tracks: list, encoded: list):
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO prepared_mixes (user_id, guild_id, mix_date, tracks, encoded)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, guild_id, mix_date, json.dumps(tracks), json.dumps(encoded)))
+            conn.commit()
+
+    @DB_LATENCY.timed(method='take_prepared_mix')
+    async def take_prepared_mix(self, user_id: int, guild_id: int) -> Optional[tuple]:
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT tracks, encoded, mix_date
+                FROM prepared_mixes
+                WHERE user_id = ? AND guild_id = ? AND mix_date = date('now')
+            ''', (user_id, guild_id))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute('''
+                DELETE FROM prepared_mixes
+                WHERE user_id = ? AND guild_id = ? AND mix_date = ?
+            ''', (user_id, guild_id, row[2]))
+            conn.commit()
+        return json.loads(row[0]), json.loads(row[1])
+
+    @DB_LATENCY.timed(method='prune_prepared_mixes')
+    async def prune_prepared_mixes(self, mix_date: str):
+        with self.connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM prepared_mixes WHERE mix_date < ?', (mix_date,))
+            conn.commit()
+
+    @DB_LATENCY.timed(method='get_daily_mix')
     async def get_daily_mix(self, user_id: int, guild_id: int) -> Optional[tuple]:
-        with sqlite3.connect(self.db_path) as conn:
+        with self.connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT tracks, created_at
@@ -146,19 +402,35 @@ class MusicPlayer(mafic.Player):
         self.history: List[mafic.Track] = []
         self.is_247 = False
         self.track_users = {}
+        self._start_time = 0
+        self.auto_paused = False
+        self._paused_position = 0
+        self.radio_buffer: List[mafic.Track] = []
+        self.radio_recent = deque(maxlen=config.RADIO_RECENT)
+        self._radio_task = None
+
+    @property
+    def log_context(self) -> dict:
+        return {
+            'guild_id': self.guild.id,
+            'channel_id': self.channel.id if self.channel else None,
+            'user_id': self.last_user_id,
+            'track': self.current_track.identifier if self.current_track else None
+        }
 
-    async def play(self, track: mafic.Track, user_id: int = None, username: str = None):
-        logger.info(f"[PLAYER] Начало воспроизведения трека: {track.title}")
+    async def play(self, track: mafic.Track, user_id: int = None, username: str = None, start_time: int = 0):
+        logger.info("[PLAYER] Начало воспроизведения трека: %s", track.title, extra=self.log_context)
         self.current_track = track
+        self._start_time = start_time
         if user_id:
             self.last_user_id = user_id
             self.last_username = username
             self.track_users[track.identifier] = {'user_id': user_id, 'username': username}
-            logger.info(f"[PLAYER] Установлен last_user_id: {user_id}, last_username: {username}")
+            logger.info("[PLAYER] Установлен last_user_id: %s, last_username: %s", user_id, username, extra=self.log_context)
         
         async with self._monitor_lock:
             if self._track_end_task and not self._track_end_task.done():
-                logger.info("[PLAYER] Отмена предыдущей задачи мониторинга")
+                logger.info("[PLAYER] Отмена предыдущей задачи мониторинга", extra=self.log_context)
                 self._track_end_task.cancel()
                 try:
                     await self._track_end_task
@@ -166,36 +438,111 @@ class MusicPlayer(mafic.Player):
                     pass
                 self._track_end_task = None
                 
-            logger.info(f"[PLAYER] Создание новой задачи мониторинга для трека: {track.title}")
+            logger.info("[PLAYER] Создание новой задачи мониторинга для трека: %s", track.title, extra=self.log_context)
             self._track_end_task = asyncio.create_task(self._track_end_monitor())
         
-        await super().play(track)
+        await super().play(track, start_time=start_time or None)
+        self.radio_recent.append(AutoplayRadio.track_key(track.title, track.author))
+        if self.is_247:
+            music_cog = self.client.get_cog('Music')
+            if music_cog:
+                music_cog.radio.watch(self)
+
+    async def auto_pause(self):
+        if self.auto_paused or not self.current_track:
+            return
+        self._paused_position = self.position
+        if self.paused:
+            return
+        self.auto_paused = True
+        async with self._monitor_lock:
+            if self._track_end_task and not self._track_end_task.done():
+                self._track_end_task.cancel()
+                try:
+                    await self._track_end_task
+                except asyncio.CancelledError:
+                    pass
+            self._track_end_task = None
+        await self.pause()
+        logger.info("[PRESENCE] Канал опустел, воспроизведение приостановлено", extra=self.log_context)
+
+    async def auto_resume(self):
+        if not self.auto_paused:
+            return
+        self.auto_paused = False
+        await self.resume()
+        if self.current_track:
+            async with self._monitor_lock:
+                self._start_time = self._paused_position
+                self._track_end_task = asyncio.create_task(self._track_end_monitor())
+        logger.info("[PRESENCE] Слушатель вернулся, воспроизведение продолжено", extra=self.log_context)
+
+    async def update(self, **kwargs):
+        if 'track' in kwargs:
+            operation = 'play' if kwargs['track'] else 'stop'
+        elif 'pause' in kwargs:
+            operation = 'pause'
+        elif 'volume' in kwargs:
+            operation = 'volume'
+        else:
+            operation = 'update'
+        with LAVALINK_LATENCY.time(operation=operation):
+            return await super().update(**kwargs)
+
+    async def fetch_tracks(self, *args, **kwargs):
+        with LAVALINK_LATENCY.time(operation='fetch_tracks'):
+            return await super().fetch_tracks(*args, **kwargs)
+
+    async def disconnect(self, *, force: bool = False):
+        if self._radio_task and not self._radio_task.done():
+            self._radio_task.cancel()
+        self.radio_buffer.clear()
+        with LAVALINK_LATENCY.time(operation='disconnect'):
+            return await super().disconnect(force=force)
 
     async def _track_end_monitor(self):
         try:
             if not self.current_track:
-                logger.info("[TRACK_MONITOR] Нет текущего трека для мониторинга")
+                logger.info("[TRACK_MONITOR] Нет текущего трека для мониторинга", extra=self.log_context)
                 return
                 
-            track_duration = self.current_track.length / 1000
-            logger.info(f"[TRACK_MONITOR] Начало мониторинга трека: {self.current_track.title} | Длительность: {track_duration:.2f}с")
+            track_duration = (self.current_track.length - self._start_time) / 1000
+            logger.info(
+                "[TRACK_MONITOR] Начало мониторинга трека: %s | Длительность: %.2fс",
+                self.current_track.title, track_duration, extra=self.log_context
+            )
             
             await asyncio.sleep(track_duration + 2)
             
             if self.is_connected and self.current_track and not self._is_skipping:
-                logger.info(f"[TRACK_MONITOR] Трек достиг конца по таймеру: {self.current_track.title}")
+                logger.info("[TRACK_MONITOR] Трек достиг конца по таймеру: %s", self.current_track.title, extra=self.log_context)
                 await self.destroy(self)
             else:
-                logger.info(f"[TRACK_MONITOR] Трек больше не играет или был пропущен: {self.current_track.title if self.current_track else 'None'}")
+                logger.info(
+                    "[TRACK_MONITOR] Трек больше не играет или был пропущен: %s",
+                    self.current_track.title if self.current_track else None, extra=self.log_context
+                )
                 
         except asyncio.CancelledError:
-            logger.info(f"[TRACK_MONITOR] Мониторинг трека отменен: {self.current_track.title if self.current_track else 'None'}")
+            logger.info(
+                "[TRACK_MONITOR] Мониторинг трека отменен: %s",
+                self.current_track.title if self.current_track else None, extra=self.log_context
+            )
         except Exception as e:
-            logger.error(f"[TRACK_MONITOR] Ошибка при мониторинге трека: {e}")
+            logger.error("[TRACK_MONITOR] Ошибка при мониторинге трека: %s", e, extra=self.log_context)
+
+    def is_radio_pick(self, track: mafic.Track) -> bool:
+        info = self.track_users.get(track.identifier)
+        return bool(info and info.get('radio'))
+
+    def clear_radio_pick(self, track: mafic.Track):
+        if self.is_radio_pick(track):
+            del self.track_users[track.identifier]
 
     async def skip(self):
         if self.current_track:
             self.history.append(self.current_track)
+            self.clear_radio_pick(self.current_track)
         self._is_skipping = True
         await self.stop()
         self._is_skipping = False
@@ -203,39 +550,46 @@ class MusicPlayer(mafic.Player):
         if self.queue:
             next_track = self.queue.pop(0)
             self.current_track = next_track
-            logger.info(f"[SKIP] Воспроизведение следующего трека: {next_track.title}")
+            logger.info("[SKIP] Воспроизведение следующего трека: %s", next_track.title, extra=self.log_context)
             
             track_info = self.track_users.get(next_track.identifier)
-            if track_info:
+            if track_info and track_info['user_id']:
                 self.last_user_id = track_info['user_id']
                 self.last_username = track_info['username']
-                logger.info(f"[SKIP] Установлен last_user_id: {self.last_user_id}, last_username: {self.last_username}")
+                logger.info(
+                    "[SKIP] Установлен last_user_id: %s, last_username: %s",
+                    self.last_user_id, self.last_username, extra=self.log_context
+                )
             
             await self.play(next_track, self.last_user_id, self.last_username)
-            
-            if self.controller_message:
-                try:
-                    bot = self.guild.me.guild._state._get_client()
-                    music_cog = bot.get_cog('Music')
-                    if music_cog:
-                        controls = MusicControls(bot, self.last_user_id)
-                        controls.update_buttons_state(self)
-                        banner_file = await music_cog.create_music_banner(self, next_track)
-                        
-                        channel = self.controller_message.channel
-                        self.controller_message = await channel.send(
-                            file=banner_file if banner_file else None,
-                            content=f"▶️ Сейчас играет: **{next_track.title}**" if not banner_file else None,
-                            view=controls
-                        )
-                except Exception as e:
-                    logger.error(f"[SKIP] Ошибка при обновлении баннера: {e}")
+            self.now_playing_changed()
         else:
-            logger.info("[SKIP] В очереди больше нет треков")
-            if self.controller_message:
-                await self.controller_message.edit(components=None)
+            music_cog = self.client.get_cog('Music')
+            if self.is_247 and music_cog:
+                track = await music_cog.radio.next_track(self)
+                if track:
+                    self.current_track = track
+                    logger.info("[SKIP] Автовоспроизведение: %s", track.title, extra=self.log_context)
+                    await self.play(track)
+                    self.now_playing_changed()
+                    return
+            logger.info("[SKIP] В очереди больше нет треков", extra=self.log_context)
+            self.clear_controller()
             await self.disconnect()
 
+    def now_playing_changed(self):
+        if self.controller_message:
+            self.client.dispatch('now_playing_changed', self)
+
+    def clear_controller(self):
+        if not self.controller_message:
+            return
+        music_cog = self.client.get_cog('Music')
+        if music_cog:
+            music_cog.dispatcher.edit(self.controller_message, components=None)
+        else:
+            asyncio.create_task(self.controller_message.edit(components=None))
+
     async def play_previous(self):
         if self.history:
             previous_track = self.history.pop()
@@ -264,85 +618,103 @@ class MusicPlayer(mafic.Player):
         await self.destroy(player)
 
     async def destroy(self, player: 'MusicPlayer'):
-        logger.info(f"[DESTROY] Обработка окончания трека. Режим повтора: {player.loop_mode} | Треков в очереди: {len(player.queue)}")
+        logger.info(
+            "[DESTROY] Обработка окончания трека. Режим повтора: %s | Треков в очереди: %d",
+            player.loop_mode, len(player.queue), extra=player.log_context
+        )
         
-        if player.current_track and player.last_user_id and player.db:
+        radio_pick = player.current_track and player.is_radio_pick(player.current_track)
+        if player.current_track and player.last_user_id and player.db and not radio_pick:
             try:
                 await player.db.add_track(
                     track_title=player.current_track.title,
                     track_author=player.current_track.author,
                     user_id=player.last_user_id,
-                    guild_id=player.guild.id
+                    guild_id=player.guild.id,
+                    artwork_url=getattr(player.current_track, 'artwork_url', None)
                 )
             except Exception as e:
-                logger.error(f"[DESTROY] Ошибка при сохранении трека в базу данных: {e}")
+                logger.error("[DESTROY] Ошибка при сохранении трека в базу данных: %s", e, extra=player.log_context)
+        if radio_pick and player.loop_mode != 'track':
+            player.clear_radio_pick(player.current_track)
         
         if not player.queue and not player.is_247:
-            logger.info("[DESTROY] Очередь пуста и режим 24/7 выключен")
-            if player.controller_message:
-                await player.controller_message.edit(components=None)
+            logger.info("[DESTROY] Очередь пуста и режим 24/7 выключен", extra=player.log_context)
+            player.clear_controller()
             return await player.disconnect()
 
         if player.loop_mode == 'track' and player.current_track:
-            logger.info(f"[DESTROY] Повтор текущего трека: {player.current_track.title}")
+            logger.info("[DESTROY] Повтор текущего трека: %s", player.current_track.title, extra=player.log_context)
             await player.play(player.current_track, player.last_user_id, self.last_username)
             return
         elif player.loop_mode == 'queue' and player.queue:
             track = player.queue.pop(0)
             player.queue.append(track)
             player.current_track = track
-            logger.info(f"[DESTROY] Повтор очереди: {track.title}")
+            logger.info("[DESTROY] Повтор очереди: %s", track.title, extra=player.log_context)
             await player.play(track, player.last_user_id, self.last_username)
+            player.now_playing_changed()
             return
         elif player.loop_mode is None and player.queue:
             player.current_track = player.queue.pop(0)
-            logger.info(f"[DESTROY] Воспроизведение следующего трека: {player.current_track.title}")
+            logger.info("[DESTROY] Воспроизведение следующего трека: %s", player.current_track.title, extra=player.log_context)
             await player.play(player.current_track, player.last_user_id, player.last_username)
-            
-            if player.controller_message:
-                try:
-                    bot = player.guild.me.guild._state._get_client()
-                    music_cog = bot.get_cog('Music')
-                    if music_cog:
-                        controls = MusicControls(bot, player.last_user_id)
-                        controls.update_buttons_state(player)
-                        banner_file = await music_cog.create_music_banner(player, player.current_track)
-                        
-                        channel = player.controller_message.channel
-                        player.controller_message = await channel.send(
-                            file=banner_file if banner_file else None,
-                            content=f"▶️ Сейчас играет: **{player.current_track.title}**" if not banner_file else None,
-                            view=controls
-                        )
-                except Exception as e:
-                    logger.error(f"[DESTROY] Ошибка при обновлении баннера: {e}")
+            player.now_playing_changed()
             return
 
-        logger.info("[DESTROY] Нет треков для воспроизведения")
+        if player.is_247:
+            music_cog = self.client.get_cog('Music')
+            track = await music_cog.radio.next_track(player) if music_cog else None
+            if track:
+                player.current_track = track
+                logger.info("[RADIO] Автовоспроизведение: %s", track.title, extra=player.log_context)
+                await player.play(track)
+                player.now_playing_changed()
+                return
+
+        logger.info("[DESTROY] Нет треков для воспроизведения", extra=player.log_context)
         if not player.is_247:
-            logger.info("[DESTROY] Режим 24/7 выключен, отключаемся")
-            if player.controller_message:
-                await player.controller_message.edit(components=None)
+            logger.info("[DESTROY] Режим 24/7 выключен, отключаемся", extra=player.log_context)
+            player.clear_controller()
             await player.disconnect()
 
 class MusicControls(disnake.ui.View):
-    def __init__(self, bot: commands.InteractionBot, user_id: int):
+    LAYOUT = [
+        ("<:volumeup:1378657097151025152>", "volume_up", 0),
+        ("<:previous:1378658319840841758>", "previous", 0),
+        ("<:pause:1378658318230491268>", "play_pause", 0),
+        ("<:skip:1378658315504058418>", "skip", 0),
+        ("", "volume_display", 0),
+        ("<:volumedown:1378657094781370378>", "volume_down", 1),
+        ("<:stop:1378658312073252934>", "stop", 1),
+        ("<:nexttracks:1378658316938510336>", "next_tracks", 1),
+        ("<:looop:1378658308533260499>", "loop", 1),
+        ("", "queue_size", 1)
+    ]
+    CACHE_SIZE = 256
+
+    def __init__(self, bot: commands.InteractionBot):
         super().__init__(timeout=None)
         self.bot = bot
-        self.user_id = user_id
+        self.buttons = {}
+        self._components = OrderedDict()
         self.add_control_buttons()
 
     async def interaction_check(self, interaction: disnake.MessageInteraction) -> bool:
+        music_cog = self.bot.get_cog('Music')
+        if music_cog and music_cog.presence.wake_later(interaction):
+            await self.send_temp_message(interaction, "⏳ Возвращаюсь в голосовой канал, повторите действие через пару секунд")
+            return False
         if not interaction.guild.voice_client:
             await self.send_temp_message(interaction, "❌ Бот не в голосовом канале!")
             return False
             
         player = interaction.guild.voice_client
         
-        if interaction.author.id != player.last_user_id:
+        if player.last_user_id and interaction.author.id != player.last_user_id:
             await self.send_temp_message(
                 interaction,
-                f"❌ Только {interaction.guild.get_member(player.last_user_id).mention} может управлять воспроизведением!"
+                f"❌ Только <@{player.last_user_id}> может управлять воспроизведением!"
             )
             return False
         return True
@@ -353,108 +725,83 @@ class MusicControls(disnake.ui.View):
             msg = await interaction.original_message()
             
             await asyncio.sleep(30)
-            try:
-                await msg.delete()
-            except:
-                pass
+            music_cog = self.bot.get_cog('Music')
+            if music_cog:
+                music_cog.dispatcher.delete(msg)
         except Exception as e:
             logger.error(f"Error in send_temp_message: {e}")
 
-    def add_control_buttons(self):
-        first_row = [
-            ("<:volumeup:1378657097151025152>", "volume_up"),
-            ("<:previous:1378658319840841758>", "previous"),
-            ("<:pause:1378658318230491268>", "play_pause"),
-            ("<:skip:1378658315504058418>", "skip"),
-            ("", "volume_display"),
-        ]
-        second_row = [
-            ("<:volumedown:1378657094781370378>", "volume_down"),
-            ("<:stop:1378658312073252934>", "stop"),
-            ("<:nexttracks:1378658316938510336>", "next_tracks"),
-            ("<:looop:1378658308533260499>", "loop"),
-            ("", "queue_size")
-        ]
+    def mark_rendered(self, player):
+        music_cog = self.bot.get_cog('Music')
+        if music_cog:
+            music_cog.refresher.mark_rendered(player)
 
-        for emoji, custom_id in first_row:
+    def add_control_buttons(self):
+        for emoji, custom_id, row in self.LAYOUT:
             button = disnake.ui.Button(
                 emoji=emoji if emoji else None,
                 custom_id=custom_id,
                 style=disnake.ButtonStyle.grey,
-                row=0
+                row=row
             )
-            if custom_id == "volume_display":
-                button.disabled = True
-            button.callback = getattr(self, f"_{custom_id}")
+            button.callback = BUTTON_LATENCY.timed(button=custom_id)(getattr(self, f"_{custom_id}"))
+            self.buttons[custom_id] = button
             self.add_item(button)
 
-        for emoji, custom_id in second_row:
-            button = disnake.ui.Button(
-                emoji=emoji if emoji else None,
-                custom_id=custom_id,
-                style=disnake.ButtonStyle.grey,
-                row=1
-            )
-            if custom_id == "queue_size":
-                button.disabled = True
-            button.callback = getattr(self, f"_{custom_id}")
-            self.add_item(button)
+    @staticmethod
+    def state_key(player) -> tuple:
+        return (
+            bool(player.current_track),
+            bool(player.queue),
+            bool(player.history),
+            player.paused,
+            player.loop_mode,
+            player.volume,
+            len(player.queue)
+        )
 
-    def update_buttons_state(self, player):
-        skip_button = next((item for item in self.children if item.custom_id == "skip"), None)
-        if skip_button:
-            skip_button.disabled = not player.queue
-
-        play_pause_button = next((item for item in self.children if item.custom_id == "play_pause"), None)
-        if play_pause_button:
-            play_pause_button.disabled = not player.current_track
-            play_pause_button.emoji = "<:pause:1378658318230491268>" if not player.paused else "<:play:1378658313755164682>"
-
-        stop_button = next((item for item in self.children if item.custom_id == "stop"), None)
-        if stop_button:
-            stop_button.disabled = not player.current_track
-
-        volume_up_button = next((item for item in self.children if item.custom_id == "volume_up"), None)
-        if volume_up_button:
-            volume_up_button.disabled = not player.current_track
-
-        volume_down_button = next((item for item in self.children if item.custom_id == "volume_down"), None)
-        if volume_down_button:
-            volume_down_button.disabled = not player.current_track
-
-        previous_button = next((item for item in self.children if item.custom_id == "previous"), None)
-        if previous_button:
-            previous_button.disabled = not player.history
-
-        next_tracks_button = next((item for item in self.children if item.custom_id == "next_tracks"), None)
-        if next_tracks_button:
-            next_tracks_button.disabled = not player.queue
-
-        volume_display_button = next((item for item in self.children if item.custom_id == "volume_display"), None)
-        if volume_display_button:
-            volume_display_button.disabled = True
-            volume_display_button.label = f"{player.volume}%"
-            volume_display_button.emoji = None
-
-        queue_size_button = next((item for item in self.children if item.custom_id == "queue_size"), None)
-        if queue_size_button:
-            queue_size_button.disabled = True
-            queue_size_button.label = f"{len(player.queue)}"
-            queue_size_button.emoji = None
-
-    def update_loop_button(self, player):
-        loop_button = next((item for item in self.children if item.custom_id == "loop"), None)
-        if loop_button:
-            if player.loop_mode == 'track':
-                loop_button.style = disnake.ButtonStyle.blurple
-                loop_button.emoji = "<:looop:1378658308533260499>"
-            elif player.loop_mode == 'queue':
-                loop_button.style = disnake.ButtonStyle.blurple
-                loop_button.emoji = "<:looop:1378658308533260499>"
-            else:
-                loop_button.style = disnake.ButtonStyle.grey
-                loop_button.emoji = "<:looop:1378658308533260499>"
-            loop_button.disabled = not player.current_track
+    @staticmethod
+    def button_state(custom_id: str, emoji: str, player) -> dict:
+        state = {
+            'emoji': emoji if emoji else None,
+            'style': disnake.ButtonStyle.grey,
+            'disabled': not player.current_track,
+            'label': None
+        }
+
+        if custom_id in ("skip", "next_tracks"):
+            state['disabled'] = not player.queue
+        elif custom_id == "previous":
+            state['disabled'] = not player.history
+        elif custom_id == "play_pause":
+            state['emoji'] = "<:pause:1378658318230491268>" if not player.paused else "<:play:1378658313755164682>"
+        elif custom_id == "loop":
+            if player.loop_mode in ('track', 'queue'):
+                state['style'] = disnake.ButtonStyle.blurple
+        elif custom_id == "volume_display":
+            state['disabled'] = True
+            state['label'] = f"{player.volume}%"
+        elif custom_id == "queue_size":
+            state['disabled'] = True
+            state['label'] = f"{len(player.queue)}"
+
+        return state
+
+    def components_for(self, player) -> List[disnake.ui.ActionRow]:
+        key = self.state_key(player)
+        rows = self._components.get(key)
+        if rows is not None:
+            self._components.move_to_end(key)
+            return rows
+
+        rows = [disnake.ui.ActionRow(), disnake.ui.ActionRow()]
+        for emoji, custom_id, row in self.LAYOUT:
+            rows[row].append_item(disnake.ui.Button(custom_id=custom_id, **self.button_state(custom_id, emoji, player)))
+
+        self._components[key] = rows
+        if len(self._components) > self.CACHE_SIZE:
+            self._components.popitem(last=False)
+        return rows
 
     async def _next_tracks(self, interaction: disnake.MessageInteraction):
         if not interaction.guild.voice_client:
@@ -504,8 +851,8 @@ class MusicControls(disnake.ui.View):
         else:
             await player.pause()
             
-        self.update_buttons_state(player)
-        await interaction.response.edit_message(view=self)
+        await interaction.response.edit_message(components=self.components_for(player))
+        self.mark_rendered(player)
 
     async def _skip(self, interaction: disnake.MessageInteraction):
         if not interaction.guild.voice_client:
@@ -537,8 +884,8 @@ class MusicControls(disnake.ui.View):
             player.loop_mode = None
             logger.info(f"[LOOP] Режим повтора выключен: {old_mode} -> None")
 
-        self.update_loop_button(player)
-        await interaction.response.edit_message(view=self)
+        await interaction.response.edit_message(components=self.components_for(player))
+        self.mark_rendered(player)
 
     async def _volume_up(self, interaction: disnake.MessageInteraction):
         if not interaction.guild.voice_client:
@@ -548,10 +895,8 @@ class MusicControls(disnake.ui.View):
         player.volume = min(200, player.volume + 10)
         await player.set_volume(player.volume)
         
-        volume_display_button = next((item for item in self.children if item.custom_id == "volume_display"), None)
-        if volume_display_button:
-            volume_display_button.label = f"{player.volume}%"
-        await interaction.response.edit_message(view=self)
+        await interaction.response.edit_message(components=self.components_for(player))
+        self.mark_rendered(player)
 
     async def _volume_down(self, interaction: disnake.MessageInteraction):
         if not interaction.guild.voice_client:
@@ -561,10 +906,8 @@ class MusicControls(disnake.ui.View):
         player.volume = max(0, player.volume - 10)
         await player.set_volume(player.volume)
         
-        volume_display_button = next((item for item in self.children if item.custom_id == "volume_display"), None)
-        if volume_display_button:
-            volume_display_button.label = f"{player.volume}%"
-        await interaction.response.edit_message(view=self)
+        await interaction.response.edit_message(components=self.components_for(player))
+        self.mark_rendered(player)
 
     async def _stop(self, interaction: disnake.MessageInteraction):
         if not interaction.guild.voice_client:
@@ -589,10 +932,554 @@ class MusicControls(disnake.ui.View):
         player = interaction.guild.voice_client
         await interaction.response.send_message(f"📋 В очереди: {len(player.queue)} треков", ephemeral=True)
 
+class HistoryView(disnake.ui.View):
+    def __init__(self, db: MusicDatabase, guild: disnake.Guild, author_id: int, user_id: Optional[int], search: Optional[str]):
+        super().__init__(timeout=config.HISTORY_VIEW_TIMEOUT)
+        self.db = db
+        self.guild = guild
+        self.author_id = author_id
+        self.user_id = user_id
+        self.search = search
+        self.cursors = [None]
+        self.rows = []
+        self.has_next = False
+
+    async def load(self):
+        rows = await self.db.get_history_page(
+            self.guild.id, self.user_id, self.search, self.cursors[-1], config.HISTORY_PAGE_SIZE + 1
+        )
+        self.has_next = len(rows) > config.HISTORY_PAGE_SIZE
+        self.rows = rows[:config.HISTORY_PAGE_SIZE]
+        self.previous_page.disabled = len(self.cursors) == 1
+        self.next_page.disabled = not self.has_next
+
+    def embed(self) -> disnake.Embed:
+        lines = []
+        for _, track_title, track_author, user_id, played_at in self.rows:
+            timestamp = int(datetime.strptime(played_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc).timestamp())
+            line = f"<t:{timestamp}:R> **{track_title}**"
+            if track_author:
+                line += f" — {track_author}"
+            if not self.user_id:
+                line += f" · <@{user_id}>"
+            lines.append(line)
+
+        title = "📜 Ваша история" if self.user_id else f"📜 История сервера {self.guild.name}"
+        embed = disnake.Embed(title=title, description="\n".join(lines), color=0xFFA500)
+        footer = f"Страница {len(self.cursors)}"
+        if self.search:
+            footer += f" · Поиск: {self.search}"
+        embed.set_footer(text=footer)
+        return embed
+
+    async def interaction_check(self, interaction: disnake.MessageInteraction) -> bool:
+        if interaction.author.id != self.author_id:
+            await interaction.response.send_message("❌ Это не ваша история!", ephemeral=True)
+            return False
+        return True
+
+    @disnake.ui.button(emoji="◀️", style=disnake.ButtonStyle.secondary)
+    async def previous_page(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
+        if len(self.cursors) > 1:
+            self.cursors.pop()
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @disnake.ui.button(emoji="▶️", style=disnake.ButtonStyle.secondary)
+    async def next_page(self, button: disnake.ui.Button, interaction: disnake.MessageInteraction):
+        if self.has_next and self.rows:
+            self.cursors.append(self.rows[-1][0])
+        await self.load()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+class ControllerRefresher:
+    def __init__(self, bot: commands.InteractionBot, controls: MusicControls, dispatcher: MessageDispatcher):
+        self.bot = bot
+        self.controls = controls
+        self.dispatcher = dispatcher
+        self.players = {}
+        self._rendered = {}
+        self._task = None
+
+    @staticmethod
+    def fingerprint(player: MusicPlayer) -> tuple:
+        return (
+            player.current_track.identifier if player.current_track else None,
+            player.volume,
+            len(player.queue),
+            player.paused,
+            player.loop_mode,
+            bool(player.history)
+        )
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def watch(self, player: MusicPlayer):
+        self.players[player.guild.id] = player
+
+    def mark_rendered(self, player: MusicPlayer):
+        self.watch(player)
+        if player.controller_message:
+            self._rendered[player.guild.id] = (
+                player.controller_message.id,
+                self.fingerprint(player),
+                time.monotonic()
+            )
+
+    def forget(self, guild_id: int):
+        self.players.pop(guild_id, None)
+        self._rendered.pop(guild_id, None)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.sleep(config.CONTROLLER_REFRESH_INTERVAL)
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[REFRESHER] Ошибка при обновлении контроллеров: {e}")
+
+    async def refresh(self):
+        now = time.monotonic()
+        for guild_id, player in list(self.players.items()):
+            message = player.controller_message
+            if not player.is_connected() or not message:
+                self.forget(guild_id)
+                continue
+
+            fingerprint = self.fingerprint(player)
+            message_id, rendered, last_edit = self._rendered.get(guild_id, (None, None, 0))
+            if message_id == message.id:
+                if rendered == fingerprint or now - last_edit < config.CONTROLLER_MIN_EDIT_INTERVAL:
+                    continue
+
+            self._rendered[guild_id] = (message.id, fingerprint, now)
+            future = self.dispatcher.edit(message, components=self.controls.components_for(player))
+            future.add_done_callback(lambda f, guild_id=guild_id: self._edit_done(guild_id, f))
+
+    def _edit_done(self, guild_id: int, future: asyncio.Future):
+        if not future.cancelled() and isinstance(future.exception(), (disnake.NotFound, disnake.Forbidden)):
+            self.forget(guild_id)
+
+class ControllerReaper:
+    def __init__(self, dispatcher: MessageDispatcher):
+        self.dispatcher = dispatcher
+        self._pending = {}
+        self._task = None
+
+    def retire(self, message):
+        if config.CONTROLLER_REAPER_ACTION and message:
+            message = channel_message(message)
+            self._pending[message.id] = message
+
+    def start(self):
+        if config.CONTROLLER_REAPER_ACTION and (not self._task or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.sleep(config.CONTROLLER_REAPER_INTERVAL)
+                self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[REAPER] Ошибка при очистке старых контроллеров: {e}")
+
+    def sweep(self):
+        if not self._pending:
+            return
+        messages = list(self._pending.values())
+        self._pending.clear()
+        for message in messages:
+            if config.CONTROLLER_REAPER_ACTION == 'delete':
+                self.dispatcher.delete(message)
+            else:
+                self.dispatcher.edit(message, components=[])
+        logger.info(f"[REAPER] Старых контроллеров обработано: {len(messages)} | Действие: {config.CONTROLLER_REAPER_ACTION}")
+
+class NowPlayingPublisher:
+    def __init__(self, music: 'Music'):
+        self.music = music
+        self.dropped = 0
+        self._generations = {}
+        self._tasks = {}
+
+    def publish(self, player: MusicPlayer):
+        guild_id = player.guild.id
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+        task = self._tasks.get(guild_id)
+        if not task or task.done():
+            self._tasks[guild_id] = asyncio.create_task(self._run(player))
+
+    async def _post(self, player: MusicPlayer, track: mafic.Track, banner_file: Optional[disnake.File]):
+        message = player.controller_message
+        components = self.music.controls.components_for(player)
+
+        if config.NOW_PLAYING_MODE == 'edit':
+            if banner_file:
+                content = {'content': None, 'file': banner_file, 'attachments': []}
+            else:
+                content = {'content': f"▶️ Сейчас играет: **{track.title}**", 'attachments': []}
+            try:
+                if await self.music.dispatcher.edit(message, components=components, **content):
+                    return
+            except disnake.NotFound:
+                pass
+            logger.info("[PUBLISHER] Сообщение контроллера удалено, отправляем новое")
+            banner_file = await self.music.create_music_banner(player, track)
+
+        player.controller_message = await self.music.dispatcher.send(
+            message.channel,
+            file=banner_file if banner_file else None,
+            content=f"▶️ Сейчас играет: **{track.title}**" if not banner_file else None,
+            components=components
+        )
+        self.music.reaper.retire(message)
+
+    def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    async def _run(self, player: MusicPlayer):
+        guild_id = player.guild.id
+        try:
+            while True:
+                generation = self._generations[guild_id]
+                track = player.current_track
+                if not track or not player.controller_message or not player.is_connected():
+                    return
+
+                banner_file = await self.music.create_music_banner(player, track)
+                if self._generations[guild_id] != generation:
+                    self.dropped += 1
+                    logger.info(f"[PUBLISHER] Баннер устарел, трек уже сменился: {track.title}")
+                    continue
+
+                await self._post(player, track, banner_file)
+                self.music.refresher.mark_rendered(player)
+
+                if self._generations[guild_id] == generation:
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[PUBLISHER] Ошибка при публикации баннера: {e}")
+        finally:
+            if self._tasks.get(guild_id) is asyncio.current_task():
+                del self._tasks[guild_id]
+                self._generations.pop(guild_id, None)
+
+class AutoplayRadio:
+    def __init__(self, music: 'Music'):
+        self.music = music
+        self.picks = 0
+        self.prefetched = 0
+        self.misses = 0
+
+    track_key = staticmethod(item_key)
+
+    def watch(self, player: MusicPlayer):
+        if not player.is_247 or len(player.queue) > config.RADIO_PREFETCH_AT:
+            return
+        if len(player.radio_buffer) >= config.RADIO_BUFFER_SIZE:
+            return
+        if player._radio_task and not player._radio_task.done():
+            return
+        player._radio_task = asyncio.create_task(self._fill(player))
+
+    async def next_track(self, player: MusicPlayer) -> Optional[mafic.Track]:
+        if not player.radio_buffer:
+            self.misses += 1
+            if not player._radio_task or player._radio_task.done():
+                player._radio_task = asyncio.create_task(self._fill(player, 1))
+            await asyncio.wait([player._radio_task])
+        if not player.radio_buffer:
+            return None
+        track = player.radio_buffer.pop(0)
+        player.track_users[track.identifier] = {
+            'user_id': player.last_user_id,
+            'username': player.last_username,
+            'radio': True
+        }
+        self.picks += 1
+        self.watch(player)
+        return track
+
+    async def candidates(self, player: MusicPlayer) -> list:
+        seed = player.current_track
+        rows = []
+        if seed:
+            rows = await self.music.recommender.similar_to(
+                player.guild.id, seed.title, seed.author, config.RADIO_CANDIDATES
+            )
+        if not rows:
+            rows = await self.music.db.get_radio_candidates(
+                player.guild.id,
+                seed.title if seed else '',
+                seed.author if seed else None,
+                config.RADIO_CANDIDATES
+            )
+        skip = set(player.radio_recent)
+        skip.update(self.track_key(track.title, track.author) for track in player.queue)
+        skip.update(self.track_key(track.title, track.author) for track in player.radio_buffer)
+
+        weights = {}
+        for track_title, track_author, play_count in rows:
+            key = self.track_key(track_title, track_author)
+            if key in skip:
+                continue
+            if key not in weights:
+                weights[key] = [track_title, track_author, 0]
+            weights[key][2] += play_count
+
+        pool = list(weights.values())
+        ordered = []
+        while pool:
+            choice = random.choices(pool, weights=[weight for _, _, weight in pool])[0]
+            pool.remove(choice)
+            ordered.append((choice[0], choice[1]))
+        return ordered
+
+    async def _fill(self, player: MusicPlayer, wanted: Optional[int] = None):
+        wanted = wanted or config.RADIO_BUFFER_SIZE - len(player.radio_buffer)
+        try:
+            for track_title, track_author in await self.candidates(player):
+                if wanted <= 0 or not player.is_connected():
+                    break
+                query = f"{track_title} {track_author}" if track_author else track_title
+                try:
+                    tracks = await player.fetch_tracks(query, mafic.SearchType.SOUNDCLOUD)
+                except mafic.errors.TrackLoadException as e:
+                    logger.warning(f"[RADIO] Не удалось загрузить {query}: {e}")
+                    continue
+                if isinstance(tracks, mafic.Playlist):
+                    tracks = tracks.tracks
+                if not tracks:
+                    continue
+                player.radio_buffer.append(tracks[0])
+                player.radio_recent.append(self.track_key(track_title, track_author))
+                self.prefetched += 1
+                wanted -= 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[RADIO] Ошибка при подготовке треков для {player.guild.id}: {e}")
+
+class MixPrecomputer:
+    def __init__(self, music: 'Music'):
+        self.music = music
+        self.prepared = 0
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    @staticmethod
+    def next_run(now: datetime) -> datetime:
+        run = now.replace(hour=config.MIX_PRECOMPUTE_HOUR, minute=0, second=0, microsecond=0)
+        return run if run > now else run + timedelta(days=1)
+
+    async def _run(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            await asyncio.sleep((self.next_run(now) - now).total_seconds())
+            try:
+                await self.precompute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[MIX] Ошибка при подготовке миксов дня: {e}")
+
+    async def precompute(self) -> int:
+        if not self.music.bot.node:
+            return 0
+        db = self.music.db
+        mix_date = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        await db.prune_prepared_mixes(mix_date)
+
+        started = time.perf_counter()
+        attempted = prepared = 0
+        for user_id, guild_id in await db.get_active_listeners(config.MIX_ACTIVE_DAYS):
+            if attempted >= config.MIX_PRECOMPUTE_BUDGET:
+                break
+            if not self.music.bot.get_guild(guild_id) or await db.has_prepared_mix(user_id, guild_id, mix_date):
+                continue
+            attempted += 1
+            tracks = await self.music.build_mix(user_id, guild_id)
+            if not tracks:
+                continue
+            resolved = await self.music.resolve_mix(tracks, delay=1 / config.MIX_RESOLVE_RATE)
+            if not resolved:
+                continue
+            await db.save_prepared_mix(user_id, guild_id, mix_date, tracks, [track.id for track in resolved])
+            prepared += 1
+
+        self.prepared += prepared
+        logger.info(
+            f"[MIX] Подготовлено миксов дня на {mix_date}: {prepared} из {attempted} "
+            f"за {time.perf_counter() - started:.0f}с"
+        )
+        return prepared
+
+class PresenceWatcher:
+    WAKE_COMMANDS = frozenset({'play', 'stop', 'mix', '247', 'shuffle'})
+
+    def __init__(self, music: 'Music'):
+        self.music = music
+        self.hibernated = {}
+        self._timers = {}
+
+    @staticmethod
+    def listeners(channel) -> list:
+        return [member for member in channel.members if not member.bot] if channel else []
+
+    def stop(self):
+        for task in self._timers.values():
+            task.cancel()
+        self._timers.clear()
+
+    def _cancel_timer(self, guild_id: int):
+        task = self._timers.pop(guild_id, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+    async def handle(self, member: disnake.Member, before: disnake.VoiceState, after: disnake.VoiceState):
+        guild = member.guild
+        if member.id == self.music.bot.user.id:
+            if after.channel is None:
+                self._cancel_timer(guild.id)
+            return
+        if member.bot or before.channel == after.channel:
+            return
+
+        player = guild.voice_client
+        if isinstance(player, MusicPlayer):
+            if player.channel in (before.channel, after.channel):
+                await self.evaluate(player)
+            return
+
+        state = self.hibernated.get(guild.id)
+        if state and after.channel and after.channel.id == state.voice_channel_id:
+            await self.rehydrate(guild)
+
+    async def evaluate(self, player: MusicPlayer):
+        guild_id = player.guild.id
+        if self.listeners(player.channel):
+            self._cancel_timer(guild_id)
+            await player.auto_resume()
+            return
+
+        await player.auto_pause()
+        if guild_id not in self._timers:
+            self._timers[guild_id] = asyncio.create_task(self._hibernate_later(player))
+
+    async def _hibernate_later(self, player: MusicPlayer):
+        guild_id = player.guild.id
+        try:
+            await asyncio.sleep(config.PRESENCE_HIBERNATE_AFTER)
+            if player.guild.voice_client is player and not self.listeners(player.channel):
+                await self.hibernate(player)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[PRESENCE] Ошибка при переводе плеера {guild_id} в спящий режим: {e}")
+        finally:
+            if self._timers.get(guild_id) is asyncio.current_task():
+                del self._timers[guild_id]
+
+    async def hibernate(self, player: MusicPlayer):
+        guild_id = player.guild.id
+        state = PlayerState.from_player(player)
+        state.position = player._paused_position
+        state.saved_at = 0
+        state.paused = player.paused and not player.auto_paused
+        self.hibernated[guild_id] = state
+        if self.music.state_store:
+            await self.music.state_store.park(state)
+
+        self.music.refresher.forget(guild_id)
+        if player._track_end_task and not player._track_end_task.done():
+            player._track_end_task.cancel()
+        await player.disconnect(force=True)
+        logger.info(f"[PRESENCE] Плеер {guild_id} переведён в спящий режим: {len(state.queue)} треков в очереди")
+
+    async def rehydrate(self, guild: disnake.Guild) -> Optional[MusicPlayer]:
+        state = self.hibernated.pop(guild.id, None)
+        if state is None or guild.voice_client:
+            return None
+        self._cancel_timer(guild.id)
+        player = await self.music.restore_player(guild, state)
+        if player:
+            logger.info(f"[PRESENCE] Плеер {guild.id} пробуждён")
+        return player
+
+    def should_wake(self, inter: disnake.Interaction) -> bool:
+        state = self.hibernated.get(inter.guild.id) if inter.guild else None
+        voice = getattr(inter.author, 'voice', None)
+        if state is None or not voice or not voice.channel or voice.channel.id != state.voice_channel_id:
+            return False
+        command = getattr(inter, 'application_command', None)
+        return command is None or command.name in self.WAKE_COMMANDS
+
+    async def _wake(self, guild: disnake.Guild) -> Optional[MusicPlayer]:
+        try:
+            return await self.rehydrate(guild)
+        except Exception as e:
+            logger.error(f"[PRESENCE] Не удалось пробудить плеер {guild.id}: {e}")
+            return None
+
+    async def wake(self, inter: disnake.ApplicationCommandInteraction) -> Optional[MusicPlayer]:
+        if not self.should_wake(inter):
+            return None
+        if not inter.response.is_done():
+            await inter.response.defer()
+        return await self._wake(inter.guild)
+
+    def wake_later(self, inter: disnake.MessageInteraction) -> Optional[asyncio.Task]:
+        if not self.should_wake(inter):
+            return None
+        return asyncio.create_task(self._wake(inter.guild))
+
 class Music(commands.Cog):
     def __init__(self, bot: commands.InteractionBot):
         self.bot = bot
         self.db = MusicDatabase()
+        self.banners = BannerRenderer()
+        self.top_banners = {}
+        self.controls = MusicControls(bot)
+        self.dispatcher = MessageDispatcher()
+        self.http = HttpClient()
+        self.refresher = ControllerRefresher(bot, self.controls, self.dispatcher)
+        self.reaper = ControllerReaper(self.dispatcher)
+        self.publisher = NowPlayingPublisher(self)
+        self.presence = PresenceWatcher(self)
+        self.radio = AutoplayRadio(self)
+        self.recommender = RecommendationEngine(self.db)
+        self.mixes = MixPrecomputer(self)
+        self.autocomplete = AutocompleteIndex(self.db)
+        backend = create_backend()
+        self.state_store = PlayerStateStore(backend, self.players) if backend else None
         self.command_usage = {}
         self.cooldown_users = set()
         logger.info("Music cog initialized")
@@ -606,10 +1493,7 @@ class Music(commands.Cog):
                 msg = await inter.original_message()
             
             await asyncio.sleep(30)
-            try:
-                await msg.delete()
-            except:
-                pass
+            self.dispatcher.delete(msg)
         except Exception as e:
             logger.error(f"Error in send_temp_message: {e}")
 
@@ -694,25 +1578,18 @@ class Music(commands.Cog):
             
             await inter.response.send_message(embed=embed, ephemeral=True)
             return False
-            
+
+        await self.presence.wake(inter)
         return True
 
     async def get_dominant_color(self, image_url: str) -> int:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        image = Image.open(BytesIO(image_data))
-                        image = image.resize((150, 150))
-                        if image.mode != 'RGB':
-                            image = image.convert('RGB')
-                        colors = image.getcolors(150*150)
-                        if not colors:
-                            return 0x2b2d31
-                        most_common = max(colors, key=lambda x: x[0])[1]
-                        r, g, b = most_common
-                        return (r << 16) + (g << 8) + b
+            image_data = await self.http.fetch_bytes(image_url)
+            if image_data:
+                image = self.banners.load_artwork(image_data, (150, 150))
+                (r, g, b), _ = self.banners.extract_palette(image)
+                return (r << 16) + (g << 8) + b
+            return 0x2b2d31
         except Exception as e:
             logger.error(f"Error getting dominant color: {e}")
             return 0x2b2d31
@@ -749,32 +1626,152 @@ class Music(commands.Cog):
         
         return embed
 
-    async def update_embed(self, player: MusicPlayer):
-        while not player.paused and player.current_track:
+    async def cog_load(self):
+        await self.http.start()
+        self.register_metrics()
+        self.bot.add_view(self.controls)
+        self.refresher.start()
+        self.reaper.start()
+        self.recommender.start()
+        self.mixes.start()
+        if self.state_store:
+            self.state_store.start()
+
+    def players(self) -> List[MusicPlayer]:
+        return [vc for vc in self.bot.voice_clients if isinstance(vc, MusicPlayer)]
+
+    async def restore_players(self):
+        if not self.state_store:
+            return
+        restored = 0
+        for guild in self.bot.guilds:
+            if guild.voice_client:
+                continue
+            state = await self.state_store.load(guild.id)
+            if not state:
+                continue
+            if not self.presence.listeners(guild.get_channel(state.voice_channel_id)):
+                state.position = state.estimated_position()
+                state.saved_at = 0
+                self.presence.hibernated[guild.id] = state
+                continue
             try:
-                controls = MusicControls(self.bot, player.last_user_id)
-                controls.update_buttons_state(player)
-                await player.controller_message.edit(view=controls)
-            except (disnake.NotFound, disnake.Forbidden):
-                break
-            await asyncio.sleep(10)
+                if await self.restore_player(guild, state):
+                    restored += 1
+            except Exception as e:
+                logger.error(f"[STATE] Не удалось восстановить плеер {guild.id}: {e}")
+        logger.info(f"[STATE] Восстановлено плееров: {restored}")
+
+    async def restore_player(self, guild: disnake.Guild, state: PlayerState) -> Optional[MusicPlayer]:
+        channel = guild.get_channel(state.voice_channel_id)
+        if not isinstance(channel, (disnake.VoiceChannel, disnake.StageChannel)):
+            if self.state_store:
+                await self.state_store.forget(guild.id)
+            return None
+
+        encoded = ([state.current] if state.current else []) + state.queue
+        tracks = await self.bot.node.decode_tracks(encoded) if encoded else []
+        current = tracks.pop(0) if state.current and tracks else None
+
+        player = await channel.connect(cls=MusicPlayer)
+        player.self_deaf = True
+        player.db = self.db
+        player.queue = tracks
+        player.loop_mode = state.loop_mode
+        player.is_247 = state.is_247
+        player.last_user_id = state.last_user_id or None
+        player.last_username = state.last_username or None
+        player.track_users = {
+            identifier: {'user_id': user_id or None, 'username': username or None, 'radio': radio}
+            for identifier, (user_id, username, radio) in state.requesters.items()
+        }
+        if state.volume != player.volume:
+            await player.set_volume(state.volume)
+            player.volume = state.volume
+
+        text_channel = guild.get_channel(state.text_channel_id)
+        if text_channel and state.controller_message_id:
+            player.controller_message = text_channel.get_partial_message(state.controller_message_id)
+
+        if current:
+            position = state.estimated_position()
+            await player.play(
+                current, player.last_user_id, player.last_username,
+                start_time=position if 0 < position < current.length else 0
+            )
+            if state.paused:
+                await player.pause()
+            player.now_playing_changed()
+        await self.presence.evaluate(player)
+        logger.info(f"[STATE] Плеер {guild.id} восстановлен: {len(player.queue)} треков в очереди")
+        return player
+
+    def register_metrics(self):
+        players = self.players
+        REGISTRY.gauge('music_active_players', 'Активные плееры').set_function(lambda: len(players()))
+        if self.state_store:
+            REGISTRY.gauge('music_state_writes', 'Записанных состояний плееров').set_function(
+                lambda: self.state_store.written
+            )
+        REGISTRY.gauge('music_queued_tracks', 'Треков в очередях всех плееров').set_function(
+            lambda: sum(len(player.queue) for player in players())
+        )
+        REGISTRY.gauge('music_radio_buffered', 'Подготовленных треков автовоспроизведения').set_function(
+            lambda: sum(len(player.radio_buffer) for player in players())
+        )
+        REGISTRY.gauge('music_radio_misses', 'Автовоспроизведений без подготовленного трека').set_function(
+            lambda: self.radio.misses
+        )
+        REGISTRY.gauge('music_recommend_items', 'Треков в индексах рекомендаций').set_function(
+            lambda: sum(len(index.labels) for index in self.recommender.indexes.values())
+        )
+        REGISTRY.gauge('music_prepared_mixes', 'Подготовленных заранее миксов дня').set_function(
+            lambda: self.mixes.prepared
+        )
+        REGISTRY.gauge('music_autocomplete_entries', 'Подсказок в индексах автодополнения').set_function(
+            lambda: sum(len(index) for index in self.autocomplete.indexes.values())
+        )
+        REGISTRY.gauge('music_pending_timers', 'Активные таймеры окончания трека').set_function(
+            lambda: sum(1 for player in players() if player._track_end_task and not player._track_end_task.done())
+        )
+        REGISTRY.gauge('bot_persistent_views', 'Зарегистрированные постоянные view').set_function(
+            lambda: len(self.bot.persistent_views)
+        )
+        REGISTRY.gauge('music_cached_controls', 'Закэшированные наборы кнопок контроллера').set_function(
+            lambda: len(self.controls._components)
+        )
+        REGISTRY.gauge('discord_dispatch_queue_depth', 'Запросов в очередях диспетчера').set_function(
+            lambda: self.dispatcher.stats()['queue_depth']
+        )
+        REGISTRY.gauge('discord_rate_limited_total', 'Полученных ответов 429').set_function(
+            lambda: self.dispatcher.stats()['rate_limited']
+        )
+
+    def cog_unload(self):
+        self.presence.stop()
+        self.recommender.stop()
+        self.mixes.stop()
+        self.refresher.stop()
+        self.publisher.stop()
+        self.reaper.stop()
+        self.reaper.sweep()
+        self.controls.stop()
+        asyncio.create_task(self.dispatcher.close())
+        asyncio.create_task(self.http.close())
+        if self.state_store:
+            asyncio.create_task(self.state_store.stop())
 
     @commands.Cog.listener()
     async def on_ready(self):
         logger.info("Bot is ready, attempting to connect to Lavalink...")
         if not self.bot.mafic_ready:
+            node = self.bot.cluster.lavalink_node
             try:
                 logger.info("Creating mafic node...")
-                logger.info(f"Connection settings: host=localhost, port=7183, password=youshallnotpass")
-                logger.info(f"Attempting to connect to Lavalink at: http://localhost:7183")
+                logger.info(f"Connection settings: host={node['host']}, port={node['port']}, label={node['label']}")
+                logger.info(f"Attempting to connect to Lavalink at: http://{node['host']}:{node['port']}")
                 
-                self.bot.node = await self.bot.pool.create_node(
-                    host='localhost',
-                    port=7183,
-                    label='main',
-                    password='youshallnotpass',
-                    secure=False
-                )
+                self.bot.node = await self.bot.pool.create_node(**node, secure=False)
                 
                 logger.info("Node created, waiting for connection...")
                 await asyncio.sleep(15)
@@ -787,8 +1784,8 @@ class Music(commands.Cog):
                     if self.bot.node.is_connected():
                         self.bot.mafic_ready = True
                         logger.info("Mafic node connected and ready!")
-                        logger.info(f"WebSocket URL: ws://localhost:7183/v3/websocket")
-                        logger.info(f"HTTP URL: http://localhost:7183/v3")
+                        logger.info(f"WebSocket URL: ws://{node['host']}:{node['port']}/v4/websocket")
+                        logger.info(f"HTTP URL: http://{node['host']}:{node['port']}/v4")
                     else:
                         logger.error("Node exists but not connected!")
                         logger.error(f"Connection status: {self.bot.node.is_connected()}")
@@ -802,14 +1799,25 @@ class Music(commands.Cog):
                 logger.error(f"Failed to connect to Lavalink: {e}")
                 logger.error(f"Error type: {type(e)}")
                 logger.error(f"Connection attempt details:")
-                logger.error(f"- Host: localhost")
-                logger.error(f"- Port: 7183")
-                logger.error(f"- Password: youshallnotpass")
+                logger.error(f"- Host: {node['host']}")
+                logger.error(f"- Port: {node['port']}")
+                logger.error(f"- Label: {node['label']}")
                 logger.error(f"- Secure: false")
                 import traceback
                 logger.error(f"Traceback: {traceback.format_exc()}")
                 self.bot.mafic_ready = False
 
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member: disnake.Member, before: disnake.VoiceState, after: disnake.VoiceState):
+        try:
+            await self.presence.handle(member, before, after)
+        except Exception as e:
+            logger.error(f"[PRESENCE] Ошибка при обработке изменения голосового состояния: {e}")
+
+    @commands.Cog.listener()
+    async def on_now_playing_changed(self, player: MusicPlayer):
+        self.publisher.publish(player)
+
     @commands.Cog.listener()
     async def on_mafic_node_ready(self, node: mafic.Node):
         logger.info(f"Mafic node ready event received for node {node.identifier}")
@@ -866,18 +1874,44 @@ class Music(commands.Cog):
             
         await inter.response.defer()
         
-        tracks = await self.db.get_most_played_tracks(inter.guild.id, 10)
+        banner = await self.get_top_banner(inter.guild)
         
-        if not tracks:
+        if banner is False:
             return await inter.edit_original_response("История пуста")
-
-        banner_file = await self.create_top_banner(tracks, inter.guild.name)
         
-        if banner_file:
-            await inter.edit_original_response(file=banner_file)
+        if banner:
+            data, filename = banner
+            await inter.edit_original_response(file=disnake.File(BytesIO(data), filename=filename))
         else:
             await inter.edit_original_response("❌ Не удалось создать баннер с топ-треками")
 
+    async def get_top_banner(self, guild: disnake.Guild):
+        version = self.db.get_history_version(guild.id)
+        cached = self.top_banners.get(guild.id)
+        
+        if cached and cached['version'] == version and cached['guild_name'] == guild.name:
+            return cached['banner']
+        
+        tracks = await self.db.get_most_played_tracks(guild.id, 10)
+        
+        if not tracks:
+            return False
+        
+        if cached and cached['ranking'] == tracks and cached['guild_name'] == guild.name:
+            cached['version'] = version
+            return cached['banner']
+        
+        banner = await self.create_top_banner(tracks, guild.name)
+        if banner:
+            self.top_banners[guild.id] = {
+                'version': version,
+                'ranking': tracks,
+                'guild_name': guild.name,
+                'banner': banner
+            }
+            logger.info(f"[TOP] Баннер топ-треков обновлен для сервера {guild.id}")
+        return banner
+
     @commands.slash_command(
         name="play",
         description="Запустить трек или плейлист",
@@ -894,7 +1928,8 @@ class Music(commands.Cog):
         if not await self.check_permissions(inter):
             return
             
-        await inter.response.defer()
+        if not inter.response.is_done():
+            await inter.response.defer()
         
         if not inter.author.voice:
             return await self.send_temp_message(inter, "❌ Вы должны быть в голосовом канале!")
@@ -918,7 +1953,11 @@ class Music(commands.Cog):
                 )
 
             try:
-                tracks = await player.fetch_tracks(query, mafic.SearchType.SOUNDCLOUD)
+                cached, query = self.autocomplete.resolve(inter.guild.id, query)
+                if cached:
+                    tracks = [cached]
+                else:
+                    tracks = await player.fetch_tracks(query, mafic.SearchType.SOUNDCLOUD)
                 if not tracks:
                     logger.warning(f"[PLAY] Трек не найден: {query}")
                     return await inter.edit_original_response("❌ Трек не найден")
@@ -935,35 +1974,29 @@ class Music(commands.Cog):
                     if player.current_track:
                         msg = await inter.edit_original_response(content="✅ Плейлист добавлен в очередь")
                         await asyncio.sleep(30)
-                        try:
-                            await msg.delete()
-                        except:
-                            pass
+                        self.dispatcher.delete(msg)
                         if player.controller_message:
-                            controls = MusicControls(self.bot, inter.author.id)
-                            controls.update_buttons_state(player)
-                            await player.controller_message.edit(view=controls)
+                            self.refresher.watch(player)
                     else:
                         player.current_track = player.queue[0]
                         player.queue.pop(0)
                         logger.info(f"[PLAY] Начало воспроизведения плейлиста. Первый трек: {player.current_track.title}")
                         await player.play(player.current_track, inter.author.id, inter.author.display_name)
-                        controls = MusicControls(self.bot, inter.author.id)
-                        controls.update_buttons_state(player)
                         banner_file = await self.create_music_banner(player, player.current_track)
                         if banner_file:
-                            player.controller_message = await inter.edit_original_response(
+                            player.controller_message = channel_message(await inter.edit_original_response(
                                 file=banner_file,
-                                view=controls
-                            )
+                                components=self.controls.components_for(player)
+                            ))
                         else:
-                            player.controller_message = await inter.edit_original_response(
+                            player.controller_message = channel_message(await inter.edit_original_response(
                                 content=f"▶️ Сейчас играет: **{player.current_track.title}**",
-                                view=controls
-                            )
-                        asyncio.create_task(self.update_embed(player))
+                                components=self.controls.components_for(player)
+                            ))
+                        self.refresher.mark_rendered(player)
                 else:
                     track = tracks[0]
+                    self.autocomplete.remember(inter.guild.id, track)
                     player.track_users[track.identifier] = {
                         'user_id': inter.author.id,
                         'username': inter.author.display_name
@@ -974,33 +2007,26 @@ class Music(commands.Cog):
                     if player.current_track:
                         msg = await inter.edit_original_response(content="✅ Трек добавлен в очередь")
                         await asyncio.sleep(30)
-                        try:
-                            await msg.delete()
-                        except:
-                            pass
+                        self.dispatcher.delete(msg)
                         if player.controller_message:
-                            controls = MusicControls(self.bot, inter.author.id)
-                            controls.update_buttons_state(player)
-                            await player.controller_message.edit(view=controls)
+                            self.refresher.watch(player)
                     else:
                         player.current_track = track
                         player.queue.pop(0)
                         logger.info(f"[PLAY] Начало воспроизведения трека: {track.title}")
                         await player.play(track, inter.author.id, inter.author.display_name)
-                        controls = MusicControls(self.bot, inter.author.id)
-                        controls.update_buttons_state(player)
                         banner_file = await self.create_music_banner(player, track)
                         if banner_file:
-                            player.controller_message = await inter.edit_original_response(
+                            player.controller_message = channel_message(await inter.edit_original_response(
                                 file=banner_file,
-                                view=controls
-                            )
+                                components=self.controls.components_for(player)
+                            ))
                         else:
-                            player.controller_message = await inter.edit_original_response(
+                            player.controller_message = channel_message(await inter.edit_original_response(
                                 content=f"▶️ Сейчас играет: **{track.title}**",
-                                view=controls
-                            )
-                        asyncio.create_task(self.update_embed(player))
+                                components=self.controls.components_for(player)
+                            ))
+                        self.refresher.mark_rendered(player)
                         
             except mafic.errors.TrackLoadException as e:
                 logger.error(f"[PLAY] Ошибка загрузки трека: {e}")
@@ -1016,6 +2042,50 @@ class Music(commands.Cog):
             logger.error(f"Traceback: {traceback.format_exc()}")
             await inter.edit_original_response("❌ Произошла ошибка при воспроизведении")
 
+    @play.autocomplete("запрос")
+    async def play_autocomplete(self, inter: disnake.ApplicationCommandInteraction, query: str):
+        if not inter.guild:
+            return {}
+        return await self.autocomplete.choices(inter.guild.id, query)
+
+    @commands.slash_command(
+        name="history",
+        description="Показать историю прослушиваний"
+    )
+    async def history(
+        self,
+        inter: disnake.ApplicationCommandInteraction,
+        scope: str = commands.Param(
+            name="область",
+            description="чью историю показать",
+            choices={"Мои треки": "user", "Весь сервер": "guild"},
+            default="user"
+        ),
+        search: str = commands.Param(
+            name="поиск",
+            description="название трека или исполнитель",
+            default=None
+        )
+    ):
+        if not await self.check_permissions(inter):
+            return
+
+        await inter.response.defer(ephemeral=True)
+
+        view = HistoryView(
+            self.db,
+            inter.guild,
+            inter.author.id,
+            inter.author.id if scope == "user" else None,
+            search
+        )
+        await view.load()
+
+        if not view.rows:
+            return await inter.edit_original_response("❌ Ничего не найдено" if search else "История пуста")
+
+        await inter.edit_original_response(embed=view.embed(), view=view)
+
     @commands.slash_command(
         name="stop",
         description="Остановить воспроизведение и отключиться"
@@ -1032,6 +2102,37 @@ class Music(commands.Cog):
         await player.disconnect()
         await self.send_temp_message(inter, "⏹️ Остановлено и отключено")
 
+    async def build_mix(self, user_id: int, guild_id: int) -> list:
+        familiar = await self.db.get_user_unique_tracks(user_id, guild_id)
+        if not familiar:
+            return []
+        recommended = await self.recommender.recommend(
+            guild_id,
+            familiar[:config.RECOMMEND_MIX_SEEDS],
+            int(len(familiar) * config.RECOMMEND_MIX_SHARE),
+            exclude=familiar
+        )
+        random.shuffle(familiar)
+        mix = familiar[:len(familiar) - len(recommended)]
+        for track in recommended:
+            mix.insert(random.randint(0, len(mix)), tuple(track))
+        return mix
+
+    async def resolve_mix(self, tracks: list, delay: float = 0) -> List[mafic.Track]:
+        playlist_tracks = []
+        for track_title, track_author in tracks:
+            try:
+                search_query = f"{track_title} {track_author}"
+                with LAVALINK_LATENCY.time(operation='fetch_tracks'):
+                    track = await self.bot.node.fetch_tracks(search_query, search_type="scsearch")
+                if track:
+                    playlist_tracks.append(track[0])
+            except Exception as e:
+                logger.error(f"Error fetching track for mix: {e}")
+            if delay:
+                await asyncio.sleep(delay)
+        return playlist_tracks
+
     @commands.slash_command(
         name="mix",
         description="Создать персональный микс дня"
@@ -1043,7 +2144,8 @@ class Music(commands.Cog):
         if not await self.check_permissions(inter):
             return
             
-        await inter.response.defer()
+        if not inter.response.is_done():
+            await inter.response.defer()
         
         existing_mix = await self.db.get_daily_mix(inter.author.id, inter.guild.id)
         
@@ -1060,25 +2162,25 @@ class Music(commands.Cog):
                     f"⏳ Ваш микс дня уже создан! Подождите еще {hours_left}ч {minutes_left}м для создания нового микса."
                 )
         
-        tracks = await self.db.get_user_unique_tracks(inter.author.id, inter.guild.id)
-        
-        if not tracks:
-            return await inter.edit_original_response("❌ У вас пока нет прослушанных треков для создания микса")
-        
-        random.shuffle(tracks)
-        
-        await self.db.save_daily_mix(inter.author.id, inter.guild.id, tracks)
-        
         playlist_tracks = []
-        for track_title, track_author in tracks:
+        prepared = await self.db.take_prepared_mix(inter.author.id, inter.guild.id)
+        if prepared:
+            tracks, encoded = prepared
             try:
-                search_query = f"{track_title} {track_author}"
-                track = await self.bot.node.fetch_tracks(search_query, search_type="scsearch")
-                if track:
-                    playlist_tracks.append(track[0])
+                playlist_tracks = await self.bot.node.decode_tracks(encoded)
             except Exception as e:
-                logger.error(f"Error fetching track for mix: {e}")
-                continue
+                logger.error(f"[MIX] Не удалось декодировать подготовленный микс: {e}")
+            if playlist_tracks:
+                await self.db.save_daily_mix(inter.author.id, inter.guild.id, tracks)
+
+        if not playlist_tracks:
+            tracks = await self.build_mix(inter.author.id, inter.guild.id)
+            
+            if not tracks:
+                return await inter.edit_original_response("❌ У вас пока нет прослушанных треков для создания микса")
+            
+            await self.db.save_daily_mix(inter.author.id, inter.guild.id, tracks)
+            playlist_tracks = await self.resolve_mix(tracks)
         
         if not playlist_tracks:
             return await inter.edit_original_response("❌ Не удалось создать микс")
@@ -1113,21 +2215,19 @@ class Music(commands.Cog):
                 player.queue.pop(0)
                 await player.play(player.current_track, inter.author.id, inter.author.display_name)
                 
-                controls = MusicControls(self.bot, inter.author.id)
-                controls.update_buttons_state(player)
                 banner_file = await self.create_music_banner(player, player.current_track)
                 
                 if banner_file:
-                    player.controller_message = await inter.edit_original_response(
+                    player.controller_message = channel_message(await inter.edit_original_response(
                         file=banner_file,
-                        view=controls
-                    )
+                        components=self.controls.components_for(player)
+                    ))
                 else:
-                    player.controller_message = await inter.edit_original_response(
+                    player.controller_message = channel_message(await inter.edit_original_response(
                         content=f"▶️ Сейчас играет: **{player.current_track.title}**",
-                        view=controls
-                    )
-                asyncio.create_task(self.update_embed(player))
+                        components=self.controls.components_for(player)
+                    ))
+                self.refresher.mark_rendered(player)
                 
         except Exception as e:
             logger.error(f"Error in mix command: {e}")
@@ -1155,6 +2255,7 @@ class Music(commands.Cog):
         
         if player.is_247:
             logger.info(f"[24/7] Режим 24/7 включен в канале {player.channel.name}")
+            self.radio.watch(player)
         else:
             logger.info(f"[24/7] Режим 24/7 выключен в канале {player.channel.name}")
             if not player.queue and not player.current_track:
@@ -1190,18 +2291,13 @@ class Music(commands.Cog):
         if player.loop_mode == 'track':
             player.loop_mode = None
             
-        await inter.response.send_message(
+        await inter.send(
             f"🔀 Очередь перемешана! Треков в очереди: {len(player.queue)}",
             ephemeral=True
         )
         
         if player.controller_message:
-            try:
-                controls = MusicControls(self.bot, player.last_user_id)
-                controls.update_buttons_state(player)
-                await player.controller_message.edit(view=controls)
-            except Exception as e:
-                logger.error(f"[SHUFFLE] Ошибка при обновлении кнопок: {e}")
+            self.refresher.watch(player)
 
     @commands.slash_command(
         name="help",
@@ -1250,6 +2346,12 @@ class Music(commands.Cog):
                     value="top",
                     emoji="<:helptop:1378687593708916887>"
                 ),
+                disnake.SelectOption(
+                    label="History",
+                    description="Показать историю прослушиваний",
+                    value="history",
+                    emoji="📜"
+                ),
                 disnake.SelectOption(
                     label="Shuffle",
                     description="Перемешать очередь",
@@ -1305,6 +2407,16 @@ class Music(commands.Cog):
                              "• Учитывает количество прослушиваний\n"
                              "• Красивый баннер с обложками"
             },
+            "history": {
+                "title": "📜 Команда History",
+                "description": "**Показывает историю прослушиваний**\n\n"
+                             "**Использование:**\n"
+                             "`/history [область] [поиск]`\n\n"
+                             "**Особенности:**\n"
+                             "• Ваши треки или весь сервер\n"
+                             "• Поиск по названию и исполнителю\n"
+                             "• Листание страниц кнопками"
+            },
             "shuffle": {
                 "title": "<:helpshuffle:1378687589653024799> Команда Shuffle",
                 "description": "**Перемешивает очередь воспроизведения**\n\n"
@@ -1357,222 +2469,63 @@ class Music(commands.Cog):
         
         await inter.response.send_message(embed=main_embed, view=view)
 
-    async def create_top_banner(self, tracks: list, guild_name: str) -> disnake.File:
+    async def create_top_banner(self, tracks: list, guild_name: str) -> Optional[tuple]:
         try:
-            width, height = 800, 400
-            
-            banner = Image.new('RGB', (width, height), (30, 30, 30))
-            draw = ImageDraw.Draw(banner)
+            artwork_data = None
+            artwork_url = tracks[0][3] if tracks else None
             
-            accent_color = (255, 165, 0)  
-            
-            if tracks and len(tracks) > 0:
+            if artwork_url:
                 try:
-                    async with aiohttp.ClientSession() as session:
-                        track_title = tracks[0][0]  
-                        search_url = f"https://api-v2.soundcloud.com/search/tracks?q={track_title}&client_id=YOUR_CLIENT_ID"
-                        async with session.get(search_url) as response:
-                            if response.status == 200:
-                                data = await response.json()
-                                if data and len(data) > 0:
-                                    artwork_url = data[0].get('artwork_url')
-                                    if artwork_url:
-                                        artwork_url = artwork_url.replace('large', 't500x500')
-                                        async with session.get(artwork_url) as img_response:
-                                            if img_response.status == 200:
-                                                image_data = await img_response.read()
-                                                album_art = Image.open(BytesIO(image_data))
-                                                
-                                                bg_image = album_art.resize((width, height))
-                                                bg_image = bg_image.filter(ImageFilter.GaussianBlur(radius=20))
-                                                overlay = Image.new('RGBA', (width, height), (0, 0, 0, 200))
-                                                bg_image = Image.alpha_composite(bg_image.convert('RGBA'), overlay).convert('RGB')
-                                                banner.paste(bg_image)
-                                                
-                                                primary_color, _ = await self.get_dominant_colors(artwork_url)
+                    artwork_data = await self.http.fetch_bytes(artwork_url)
                 except Exception as e:
                     logger.error(f"Error loading background image: {e}")
             
-            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 50))
-            banner = Image.alpha_composite(banner.convert('RGBA'), overlay).convert('RGB')
-            draw = ImageDraw.Draw(banner)
-            
-            title_font = self.get_font_path("arial.ttf", 28)
-            track_font = self.get_font_path("arial.ttf", 18)
-            info_font = self.get_font_path("arial.ttf", 14)
-            
-            title = f"Самые популярные треки на {guild_name}"
-            draw.text((width//2, 20), title, font=title_font, fill=(255, 255, 255), anchor="mm")
-            
-            draw.line([(50, 60), (width - 50, 60)], fill=accent_color, width=2)
-            
-            current_y = 90
-            tracks_per_column = 5
-            column_width = width // 2
-            
-            for i, (track_title, track_author, play_count) in enumerate(tracks[:10], 1):
-                column = 0 if i <= tracks_per_column else 1
-                x_offset = 50 + (column * column_width)
-                
-                draw.text((x_offset, current_y), f"#{i}", font=track_font, fill=accent_color)
-                
-                track_title = track_title if len(track_title) <= 25 else track_title[:22] + "..."
-                draw.text((x_offset + 30, current_y), track_title, font=track_font, fill=(255, 255, 255))
-                
-                info_text = f"👤 {track_author} • ▶️ {play_count}"
-                draw.text((x_offset + 30, current_y + 25), info_text, font=info_font, fill=(200, 200, 200))
-                
-                if i == tracks_per_column:
-                    current_y = 90
-                else:
-                    current_y += 50
-            
-            temp_file = BytesIO()
-            banner.save(temp_file, format='PNG')
-            temp_file.seek(0)
+            temp_file, filename = await asyncio.to_thread(
+                self.banners.top_banner_file, tracks, guild_name, artwork_data
+            )
             
-            return disnake.File(temp_file, filename='top_tracks.png')
+            return temp_file.getvalue(), filename
             
         except Exception as e:
             logger.error(f"Ошибка при создании баннера топ-треков: {e}")
             return None
 
     def get_font_path(self, font_name: str, size: int):
-        try:
-            from PIL import ImageFont
-            try:
-                return ImageFont.truetype(font_name, size)
-            except:
-                try:
-                    return ImageFont.truetype("DejaVuSans.ttf", size)
-                except:
-                    return ImageFont.load_default()
-        except Exception as e:
-            logger.error(f"Error loading font: {e}")
-            return ImageFont.load_default()
+        return self.banners.get_font(font_name, size)
 
     async def get_dominant_colors(self, image_url: str) -> tuple:
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        image = Image.open(BytesIO(image_data))
-                        image = image.resize((150, 150))
-                        if image.mode != 'RGB':
-                            image = image.convert('RGB')
-                        colors = image.getcolors(150*150)
-                        if not colors:
-                            return (43, 45, 49), (100, 100, 100)
-                        most_common = max(colors, key=lambda x: x[0])[1]
-                        r, g, b = most_common
-                        accent_r = min(255, r + 50)
-                        accent_g = min(255, g + 50)
-                        accent_b = min(255, b + 50)
-                        return (r, g, b), (accent_r, accent_g, accent_b)
+            image_data = await self.http.fetch_bytes(image_url)
+            if image_data:
+                image = self.banners.load_artwork(image_data, (150, 150))
+                return self.banners.extract_palette(image)
+            return (43, 45, 49), (100, 100, 100)
         except Exception as e:
             logger.error(f"Error getting dominant colors: {e}")
             return (43, 45, 49), (100, 100, 100)
 
     async def create_music_banner(self, player: 'MusicPlayer', track: mafic.Track) -> disnake.File:
         try:
-            width, height = 800, 300
-            
-            banner = Image.new('RGB', (width, height), (30, 30, 30))
-            draw = ImageDraw.Draw(banner)
-            
-            album_art = None
-            primary_color = (43, 45, 49)
-            accent_color = (100, 100, 100)
-            
-            if hasattr(track, 'artwork_url') and track.artwork_url:
+            artwork_url = track.artwork_url if hasattr(track, 'artwork_url') else None
+            artwork_data = None
+
+            if artwork_url and not self.banners.is_cached(artwork_url):
                 try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(track.artwork_url) as response:
-                            if response.status == 200:
-                                image_data = await response.read()
-                                album_art = Image.open(BytesIO(image_data))
-                                album_art = album_art.resize((250, 250))
-                                
-                                primary_color, accent_color = await self.get_dominant_colors(track.artwork_url)
+                    artwork_data = await self.http.fetch_bytes(artwork_url)
                 except Exception as e:
                     logger.error(f"Error loading album art: {e}")
+
+            temp_file, filename = await asyncio.to_thread(
+                self.banners.music_banner_file,
+                artwork_url,
+                artwork_data,
+                track.title,
+                track.author,
+                track.length,
+                player.last_username
+            )
             
-            if album_art:
-                bg_image = album_art.resize((width, height))
-                bg_image = bg_image.filter(ImageFilter.GaussianBlur(radius=20))
-                overlay = Image.new('RGBA', (width, height), (0, 0, 0, 200))
-                bg_image = Image.alpha_composite(bg_image.convert('RGBA'), overlay).convert('RGB')
-                banner.paste(bg_image)
-            else:
-                for x in range(width):
-                    ratio = x / width
-                    r = int(primary_color[0] * (1 - ratio) + accent_color[0] * ratio * 0.3)
-                    g = int(primary_color[1] * (1 - ratio) + accent_color[1] * ratio * 0.3)
-                    b = int(primary_color[2] * (1 - ratio) + accent_color[2] * ratio * 0.3)
-                    
-                    for y in range(height):
-                        y_ratio = y / height
-                        final_r = int(r * (1 - y_ratio * 0.2))
-                        final_g = int(g * (1 - y_ratio * 0.2))
-                        final_b = int(b * (1 - y_ratio * 0.2))
-                        draw.point((x, y), (final_r, final_g, final_b))
-            
-            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 50))
-            banner = Image.alpha_composite(banner.convert('RGBA'), overlay).convert('RGB')
-            draw = ImageDraw.Draw(banner)
-            
-            if album_art:
-                shadow_offset = 8
-                shadow = Image.new('RGBA', (250 + shadow_offset, 250 + shadow_offset), (0, 0, 0, 80))
-                banner.paste(shadow, (25 + shadow_offset, 25 + shadow_offset), shadow)
-                
-                border = Image.new('RGB', (254, 254), accent_color)
-                banner.paste(border, (23, 23))
-                banner.paste(album_art, (25, 25))
-            else:
-                placeholder_color = accent_color
-                draw.rectangle([25, 25, 275, 275], fill=placeholder_color, outline=(255, 255, 255), width=2)
-                
-                note_size = 100
-                note_x = 150 - note_size // 2
-                note_y = 150 - note_size // 2
-                draw.ellipse([note_x, note_y + 60, note_x + 40, note_y + 100], fill=(255, 255, 255))
-                draw.rectangle([note_x + 35, note_y, note_x + 40, note_y + 70], fill=(255, 255, 255))
-                draw.ellipse([note_x + 30, note_y - 10, note_x + 50, note_y + 10], fill=(255, 255, 255))
-            
-            title_font = self.get_font_path("DejaVuSans.ttf", 32)
-            artist_font = self.get_font_path("DejaVuSans.ttf", 24)
-            info_font = self.get_font_path("DejaVuSans.ttf", 18)
-            label_font = self.get_font_path("DejaVuSans.ttf", 14)
-            
-            text_x = 300
-            current_y = 40
-            
-            draw.text((text_x, current_y), "♪ СЕЙЧАС ИГРАЕТ", font=label_font, fill=accent_color)
-            current_y += 35
-            
-            track_title = track.title if len(track.title) <= 35 else track.title[:32] + "..."
-            draw.text((text_x, current_y), track_title, font=title_font, fill=(255, 255, 255))
-            current_y += 45
-            
-            if track.author:
-                artist_name = track.author if len(track.author) <= 40 else track.author[:37] + "..."
-                draw.text((text_x, current_y), f"Исполнитель: {artist_name}", font=artist_font, fill=(200, 200, 200))
-                current_y += 40
-            
-            duration = time.strftime("%M:%S", time.gmtime(track.length / 1000))
-            draw.text((text_x, current_y), f"Длительность: {duration}", font=info_font, fill=(180, 180, 180))
-            current_y += 30
-            
-            if player.last_username:
-                draw.text((text_x, current_y), f"Добавил: {player.last_username}", font=info_font, fill=(180, 180, 180))
-            
-            temp_file = BytesIO()
-            banner.save(temp_file, format='PNG')
-            temp_file.seek(0)
-            
-            return disnake.File(temp_file, filename='music_banner.png')
+            return disnake.File(temp_file, filename=filename)
             
         except Exception as e:
             logger.error(f"Ошибка при создании баннера: {e}")
@@ -2,4 +2,135 @@ LAVALINK_HOST = 'localhost'
 LAVALINK_PORT = 2333
 LAVALINK_PASSWORD = 'youshallnotpass'
 LAVALINK_BASE_URL = f'http://{LAVALINK_HOST}:{LAVALINK_PORT}/v4'
-LAVALINK_SEARCH_SOURCE = ''  
\ No newline at end of file
+LAVALINK_SEARCH_SOURCE = ''  
+
+BANNER_CACHE_SIZE = 32
+
+# PNG, PNG8 (палитра), WEBP или JPEG
+BANNER_FORMAT = 'WEBP'
+BANNER_QUALITY = 85
+BANNER_MIN_QUALITY = 40
+# 0 - без ограничения размера
+BANNER_MAX_BYTES = 300_000
+
+CONTROLLER_REFRESH_INTERVAL = 2
+CONTROLLER_MIN_EDIT_INTERVAL = 5
+
+DISPATCH_CHANNEL_RATE = 5
+DISPATCH_CHANNEL_PERIOD = 5
+
+# new - новое сообщение на каждый трек, edit - одно сообщение редактируется на месте
+NOW_PLAYING_MODE = 'new'
+# strip - убрать кнопки, delete - удалить сообщение, None - не трогать старые контроллеры
+CONTROLLER_REAPER_ACTION = 'strip'
+CONTROLLER_REAPER_INTERVAL = 30
+
+HTTP_POOL_LIMIT = 50
+HTTP_POOL_LIMIT_PER_HOST = 8
+HTTP_DNS_TTL = 300
+HTTP_CONNECT_TIMEOUT = 3
+HTTP_READ_TIMEOUT = 5
+HTTP_MAX_IMAGE_BYTES = 4 * 1024 * 1024
+
+METRICS_HOST = '127.0.0.1'
+# 0 - не запускать эндпоинт метрик
+METRICS_PORT = 9100
+
+LOOP_LAG_INTERVAL = 0.5
+# задержка, после которой снимается стек блокирующего кода
+LOOP_LAG_THRESHOLD = 0.25
+
+OWNER_ID = 1193877999465025586
+
+PROFILE_INTERVAL = 0.01
+# профилировщик останавливается сам, даже если забыть /profile stop
+PROFILE_MAX_DURATION = 300
+
+LOG_FILE = 'bot.log'
+LOG_LEVEL = 'INFO'
+# JSON в файле, человекочитаемый текст в консоли
+LOG_JSON = True
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+# минимальный уровень для отдельных категорий сообщений ([PLAYER], [DESTROY] и т.д.)
+LOG_CATEGORY_LEVELS = {
+    'TRACK_MONITOR': 'INFO',
+    'PLAYER': 'INFO',
+    'DESTROY': 'INFO',
+    'SKIP': 'INFO',
+}
+# записывается только каждое N-е INFO/DEBUG сообщение категории, WARNING и выше - всегда
+LOG_SAMPLE_RATES = {
+    'TRACK_MONITOR': 10,
+    'PLAYER': 5,
+    'DESTROY': 5,
+    'SKIP': 2,
+}
+MANAGER_LOG_FILE = 'manager.log'
+
+# None - количество шардов берётся из рекомендации Discord
+SHARD_COUNT = None
+# больше 1 - start.py запускает шарды несколькими процессами-кластерами
+CLUSTER_COUNT = 1
+CLUSTER_RESTART_DELAY = 5
+# кластер N подключается к узлу LAVALINK_NODES[N % len(LAVALINK_NODES)]
+LAVALINK_NODES = [
+    {'host': '127.0.0.1', 'port': 7183, 'password': 'youshallnotpass', 'label': 'MAIN'},
+]
+
+# общая база истории для всех кластеров
+DB_PATH = 'music_history.db'
+DB_BUSY_TIMEOUT = 10
+
+# None - состояние плееров живёт только в памяти процесса, 'memory' или 'redis'
+STATE_BACKEND = None
+STATE_REDIS_URL = 'redis://127.0.0.1:6379/0'
+STATE_KEY_PREFIX = 'musicbot:player:'
+STATE_FLUSH_INTERVAL = 2
+STATE_TTL = 24 * 60 * 60
+
+# 'lean' - только guilds и voice_states, кэш участников только для голосовых каналов, без кэша сообщений
+# 'default' - Intents.default() с message_content, как раньше
+CACHE_PROFILE = 'lean'
+
+# сколько секунд плеер стоит на паузе в пустом канале, прежде чем отключиться от Lavalink и голосового канала
+PRESENCE_HIBERNATE_AFTER = 300
+
+# автовоспроизведение в режиме 24/7: сколько треков держать заранее найденными
+RADIO_BUFFER_SIZE = 3
+# подготовка начинается, когда в очереди осталось столько треков или меньше
+RADIO_PREFETCH_AT = 1
+RADIO_CANDIDATES = 25
+# сколько последних треков не повторять
+RADIO_RECENT = 50
+
+# рекомендации: треки одного пользователя с перерывом не больше RECOMMEND_SESSION_GAP секунд считаются одной сессией
+RECOMMEND_SESSION_GAP = 30 * 60
+# сколько предыдущих треков сессии связываются с очередным
+RECOMMEND_WINDOW = 5
+RECOMMEND_NEIGHBORS = 50
+RECOMMEND_BATCH_SIZE = 5000
+RECOMMEND_REFRESH_INTERVAL = 300
+# сколько гильдий держать в памяти и через сколько секунд без запросов индекс выгружается
+RECOMMEND_GUILDS = 200
+RECOMMEND_IDLE_TIMEOUT = 60 * 60
+# доля рекомендованных треков в миксе дня и сколько последних треков пользователя берётся за основу
+RECOMMEND_MIX_SHARE = 0.4
+RECOMMEND_MIX_SEEDS = 20
+
+# миксы дня готовятся заранее каждый день в этот час (UTC) для недавно активных слушателей
+MIX_PRECOMPUTE_HOUR = 4
+MIX_PRECOMPUTE_BUDGET = 200
+MIX_ACTIVE_DAYS = 3
+# поисковых запросов к Lavalink в секунду при подготовке
+MIX_RESOLVE_RATE = 5
+
+# автодополнение /play: подсказок на гильдию и сколько гильдий держать в памяти
+AUTOCOMPLETE_ENTRIES = 2000
+AUTOCOMPLETE_GUILDS = 500
+# сколько последних записей истории читать при заполнении индекса гильдии
+AUTOCOMPLETE_SEED_ROWS = 20000
+
+# /history: записей на странице и сколько секунд работают кнопки листания
+HISTORY_PAGE_SIZE = 10
+HISTORY_VIEW_TIMEOUT = 300
@@ -7,23 +7,44 @@ import psutil
 import logging
 from pathlib import Path
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('bot.log')
-    ]
-)
+from dotenv import load_dotenv
+
+import config
+from utils.cluster import ClusterInfo, plan_clusters, recommended_shards
+from utils.logsetup import setup_logging
+
+setup_logging(config.MANAGER_LOG_FILE)
 
 logger = logging.getLogger(__name__)
 
+load_dotenv()
+
 class ProcessManager:
     def __init__(self):
         self.lavalink_process = None
-        self.bot_process = None
+        self.clusters = []
+        self.bot_processes = {}
+        self.restart_at = {}
         self.is_shutting_down = False
 
+    def plan_clusters(self):
+        if config.CLUSTER_COUNT <= 1:
+            self.clusters = [ClusterInfo(0, 1, None, config.SHARD_COUNT)]
+            return
+
+        shard_count = config.SHARD_COUNT
+        if shard_count is None:
+            try:
+                shard_count = recommended_shards(os.getenv('TOKEN'))
+                logger.info(f"Discord recommends {shard_count} shards")
+            except Exception as e:
+                logger.error(f"Failed to fetch recommended shard count: {e}")
+                shard_count = config.CLUSTER_COUNT
+
+        self.clusters = plan_clusters(config.CLUSTER_COUNT, shard_count)
+        for cluster in self.clusters:
+            logger.info(f"Cluster {cluster.cluster_id}: shards {cluster.shard_ids} of {cluster.shard_count}")
+
     def start_lavalink(self):
         try:
             if not os.path.exists('lavalink/Lavalink.jar'):
@@ -48,17 +69,21 @@ class ProcessManager:
             return False
 
     def start_bot(self):
+        if not self.clusters:
+            self.plan_clusters()
+        return all(self.start_cluster(cluster) for cluster in self.clusters)
+
+    def start_cluster(self, cluster: ClusterInfo):
         try:
-            logger.info("Starting Discord bot...")
-            self.bot_process = subprocess.Popen(
+            logger.info(f"Starting Discord bot cluster {cluster.cluster_id}...")
+            self.bot_processes[cluster.cluster_id] = subprocess.Popen(
                 [sys.executable, 'bot.py'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                env={**os.environ, **cluster.env()},
                 text=True
             )
             return True
         except Exception as e:
-            logger.error(f"Failed to start bot: {e}")
+            logger.error(f"Failed to start bot cluster {cluster.cluster_id}: {e}")
             return False
 
     def stop_processes(self):
@@ -68,12 +93,16 @@ class ProcessManager:
         self.is_shutting_down = True
         logger.info("Shutting down processes...")
 
-        if self.bot_process:
+        for process in self.bot_processes.values():
+            try:
+                process.terminate()
+            except Exception as e:
+                logger.error(f"Error stopping bot process: {e}")
+        for process in self.bot_processes.values():
             try:
-                self.bot_process.terminate()
-                self.bot_process.wait(timeout=5)
+                process.wait(timeout=5)
             except subprocess.TimeoutExpired:
-                self.bot_process.kill()
+                process.kill()
             except Exception as e:
                 logger.error(f"Error stopping bot process: {e}")
 
@@ -90,10 +119,20 @@ class ProcessManager:
 
     def monitor_processes(self):
         while not self.is_shutting_down:
-            if self.bot_process and self.bot_process.poll() is not None:
-                logger.info("Bot process stopped, restarting...")
-                self.stop_processes()
-                break
+            for cluster in self.clusters:
+                process = self.bot_processes.get(cluster.cluster_id)
+                if process is None or process.poll() is None:
+                    continue
+                restart_at = self.restart_at.get(cluster.cluster_id)
+                if restart_at is None:
+                    logger.info(
+                        f"Bot cluster {cluster.cluster_id} stopped with code {process.returncode}, "
+                        f"restarting in {config.CLUSTER_RESTART_DELAY}s..."
+                    )
+                    self.restart_at[cluster.cluster_id] = time.monotonic() + config.CLUSTER_RESTART_DELAY
+                elif time.monotonic() >= restart_at:
+                    del self.restart_at[cluster.cluster_id]
+                    self.start_cluster(cluster)
 
             if self.lavalink_process and self.lavalink_process.poll() is not None:
                 logger.info("Lavalink process stopped, restarting...")
@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+from utils.playerstate import MemoryStateBackend, PlayerState, PlayerStateStore
+
+
+def make_track(identifier: str) -> SimpleNamespace:
+    return SimpleNamespace(id=f"encoded-{identifier}", identifier=identifier)
+
+
+def make_player(guild_id: int, queue: int = 2) -> SimpleNamespace:
+    return SimpleNamespace(
+        guild=SimpleNamespace(id=guild_id),
+        channel=SimpleNamespace(id=guild_id * 10),
+        controller_message=None,
+        current_track=make_track('current'),
+        queue=[make_track(f"queued-{i}") for i in range(queue)],
+        track_users={
+            'current': {'user_id': 7, 'username': 'Слушатель'},
+            'queued-0': {'user_id': 7, 'username': 'Слушатель', 'radio': True},
+        },
+        loop_mode='queue',
+        volume=80,
+        is_247=True,
+        paused=False,
+        last_user_id=7,
+        last_username='Слушатель',
+        position=12_000,
+    )
+
+
+def test_encode_decode_round_trip():
+    state = PlayerState(
+        guild_id=1,
+        voice_channel_id=2,
+        text_channel_id=3,
+        controller_message_id=4,
+        loop_mode='track',
+        volume=150,
+        is_247=True,
+        paused=True,
+        last_user_id=5,
+        last_username='Слушатель',
+        position=42_000,
+        saved_at=1_700_000_000_000,
+        current='encoded-current',
+        queue=['encoded-a', 'encoded-b'],
+        requesters={'a': (5, 'Слушатель', False), 'b': (5, 'Слушатель', True)},
+    )
+
+    decoded = PlayerState.decode(state.encode())
+
+    for name in PlayerState.__slots__:
+        assert getattr(decoded, name) == getattr(state, name), name
+
+
+def test_memory_backend_round_trip_through_store():
+    async def scenario():
+        backend = MemoryStateBackend()
+        players = [make_player(1), make_player(2)]
+        store = PlayerStateStore(backend, lambda: players)
+
+        await store.flush()
+        assert backend.writes == 1
+        assert set(backend.data) == {store.key(1), store.key(2)}
+
+        state = await store.load(1)
+        assert state.current == 'encoded-current'
+        assert state.queue == ['encoded-queued-0', 'encoded-queued-1']
+        assert state.requesters == {
+            'current': (7, 'Слушатель', False),
+            'queued-0': (7, 'Слушатель', True),
+        }
+        assert (state.loop_mode, state.volume, state.is_247, state.position) == ('queue', 80, True, 12_000)
+
+        await store.flush()
+        assert backend.writes == 1
+
+        players.pop()
+        await store.flush()
+        assert await store.load(2) is None
+        assert await store.load(1) is not None
+
+        await store.forget(1)
+        assert await store.load(1) is None
+        assert backend.data == {}
+
+        await store.park(state)
+        assert (await store.load(1)).queue == state.queue
+
+    asyncio.run(scenario())
+
+
+def test_load_ignores_corrupt_state():
+    async def scenario():
+        backend = MemoryStateBackend()
+        store = PlayerStateStore(backend, list)
+        backend.data[store.key(1)] = b'not a player state'
+        assert await store.load(1) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,179 @@
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import config
+from utils.recommend import item_key
+
+TOKEN_PREFIX = 'ac:'
+CHOICE_LIMIT = 25
+VALUE_LIMIT = 100
+SCAN_LIMIT = 500
+WORD = re.compile(r'\w+')
+
+logger = logging.getLogger('autocomplete')
+
+
+def normalize(text: str) -> str:
+    return ' '.join(text.casefold().split())
+
+
+class Suggestion:
+    __slots__ = ('id', 'title', 'author', 'weight', 'track')
+
+    def __init__(self, suggestion_id: int, title: str, author: Optional[str], weight: int, track=None):
+        self.id = suggestion_id
+        self.title = title
+        self.author = author
+        self.weight = weight
+        self.track = track
+
+    @property
+    def query(self) -> str:
+        return f"{self.title} {self.author}" if self.author else self.title
+
+    @property
+    def name(self) -> str:
+        label = f"{self.title} — {self.author}" if self.author else self.title
+        return label if len(label) <= VALUE_LIMIT else label[:VALUE_LIMIT - 1] + '…'
+
+    @property
+    def value(self) -> str:
+        if self.track is None:
+            return self.query[:VALUE_LIMIT]
+        return f"{TOKEN_PREFIX}{self.id}:{self.query}"[:VALUE_LIMIT]
+
+
+class PrefixIndex:
+    def __init__(self, limit: int = config.AUTOCOMPLETE_ENTRIES):
+        self.limit = limit
+        self.entries: OrderedDict = OrderedDict()
+        self.by_id: Dict[int, Suggestion] = {}
+        self._keys: List[Tuple[str, int]] = []
+        self._dirty = False
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, title: str, author: Optional[str], weight: int = 1, track=None) -> Suggestion:
+        key = item_key(title, author)
+        suggestion = self.entries.get(key)
+        if suggestion is not None:
+            suggestion.weight += weight
+            if track is not None:
+                suggestion.track = track
+            self.entries.move_to_end(key)
+            return suggestion
+
+        self._next_id += 1
+        suggestion = self.entries[key] = self.by_id[self._next_id] = Suggestion(
+            self._next_id, title, author, weight, track
+        )
+        while len(self.entries) > self.limit:
+            _, evicted = self.entries.popitem(last=False)
+            del self.by_id[evicted.id]
+        self._dirty = True
+        return suggestion
+
+    def _rebuild(self):
+        keys = []
+        for suggestion in self.entries.values():
+            text = normalize(suggestion.query)
+            keys.extend((text[match.start():], suggestion.id) for match in WORD.finditer(text))
+        keys.sort()
+        self._keys = keys
+        self._dirty = False
+
+    def search(self, prefix: str, limit: int = CHOICE_LIMIT) -> List[Suggestion]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return heapq.nlargest(limit, self.entries.values(), key=lambda suggestion: suggestion.weight)
+        if self._dirty:
+            self._rebuild()
+
+        keys = self._keys
+        found = {}
+        position = bisect.bisect_left(keys, (prefix,))
+        while position < len(keys) and len(found) < SCAN_LIMIT:
+            text, suggestion_id = keys[position]
+            if not text.startswith(prefix):
+                break
+            suggestion = self.by_id.get(suggestion_id)
+            if suggestion is not None:
+                found[suggestion_id] = suggestion
+            position += 1
+        return heapq.nlargest(limit, found.values(), key=lambda suggestion: suggestion.weight)
+
+
+class AutocompleteIndex:
+    def __init__(
+        self,
+        db,
+        guilds: int = config.AUTOCOMPLETE_GUILDS,
+        entries: int = config.AUTOCOMPLETE_ENTRIES,
+        seed_rows: int = config.AUTOCOMPLETE_SEED_ROWS
+    ):
+        self.db = db
+        self.guilds = guilds
+        self.entries = entries
+        self.seed_rows = seed_rows
+        self.indexes: OrderedDict = OrderedDict()
+        self._seeding: Dict[int, asyncio.Task] = {}
+
+    def index(self, guild_id: int) -> PrefixIndex:
+        index = self.indexes.get(guild_id)
+        if index is not None:
+            self.indexes.move_to_end(guild_id)
+            return index
+
+        index = self.indexes[guild_id] = PrefixIndex(self.entries)
+        self._seeding[guild_id] = asyncio.create_task(self._seed(guild_id, index))
+        while len(self.indexes) > self.guilds:
+            evicted, _ = self.indexes.popitem(last=False)
+            task = self._seeding.pop(evicted, None)
+            if task:
+                task.cancel()
+        return index
+
+    async def _seed(self, guild_id: int, index: PrefixIndex):
+        try:
+            rows = await self.db.get_recent_popular_tracks(guild_id, self.seed_rows, self.entries)
+            live = list(index.entries.values())
+            for track_title, track_author, play_count, _ in reversed(rows):
+                index.add(track_title, track_author, play_count)
+            for suggestion in live:
+                key = item_key(suggestion.title, suggestion.author)
+                if key in index.entries:
+                    index.entries.move_to_end(key)
+        except Exception as e:
+            logger.error(f"[AUTOCOMPLETE] Ошибка при заполнении индекса гильдии {guild_id}: {e}")
+        finally:
+            if self._seeding.get(guild_id) is asyncio.current_task():
+                del self._seeding[guild_id]
+
+    async def choices(self, guild_id: int, text: str) -> Dict[str, str]:
+        index = self.index(guild_id)
+        choices = {}
+        for suggestion in index.search(text):
+            choices.setdefault(suggestion.name, suggestion.value)
+        return choices
+
+    def remember(self, guild_id: int, track):
+        index = self.indexes.get(guild_id)
+        if index is not None:
+            index.add(track.title, track.author, track=track)
+
+    def resolve(self, guild_id: int, value: str) -> tuple:
+        if not value.startswith(TOKEN_PREFIX):
+            return None, value
+        token, _, query = value[len(TOKEN_PREFIX):].partition(':')
+        index = self.indexes.get(guild_id)
+        suggestion = index.by_id.get(int(token)) if index is not None and token.isdigit() else None
+        if suggestion is not None and suggestion.track is not None:
+            return suggestion.track, query
+        return None, query or value
@@ -0,0 +1,376 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image, ImageChops, ImageDraw, ImageFilter, ImageFont
+
+import config
+from utils.metrics import RENDER_LATENCY
+
+logger = logging.getLogger('banners')
+
+DEFAULT_PRIMARY = (43, 45, 49)
+DEFAULT_ACCENT = (100, 100, 100)
+DEFAULT_PALETTE = (DEFAULT_PRIMARY, DEFAULT_ACCENT)
+
+MUSIC_BANNER_SIZE = (800, 300)
+TOP_BANNER_SIZE = (800, 400)
+TOP_ACCENT = (255, 165, 0)
+COVER_SIZE = (250, 250)
+BACKGROUND_SCALE = 4
+
+EXTENSIONS = {'PNG': 'png', 'PNG8': 'png', 'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+class BannerRenderer:
+    def __init__(
+        self,
+        cache_size: int = config.BANNER_CACHE_SIZE,
+        image_format: str = config.BANNER_FORMAT,
+        quality: int = config.BANNER_QUALITY,
+        max_bytes: int = config.BANNER_MAX_BYTES
+    ):
+        self.cache_size = cache_size
+        self.image_format = image_format.upper()
+        if self.image_format not in EXTENSIONS:
+            logger.warning(f"[BANNER] Неизвестный формат {image_format}, используется PNG")
+            self.image_format = 'PNG'
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.render_stats = deque(maxlen=100)
+        self._layers: OrderedDict = OrderedDict()
+        self._palettes: OrderedDict = OrderedDict()
+        self._fonts = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_font(self, font_name: str, size: int):
+        key = (font_name, size)
+        font = self._fonts.get(key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(font_name, size)
+            except Exception:
+                try:
+                    font = ImageFont.truetype("DejaVuSans.ttf", size)
+                except Exception:
+                    font = ImageFont.load_default()
+            self._fonts[key] = font
+        return font
+
+    def is_cached(self, artwork_url: Optional[str]) -> bool:
+        palette = self._palettes.get(artwork_url)
+        return palette is not None and (artwork_url, palette) in self._layers
+
+    def clear(self):
+        self._layers.clear()
+        self._palettes.clear()
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _get_layer(self, key) -> Optional[Image.Image]:
+        layer = self._layers.get(key)
+        if layer is not None:
+            self._layers.move_to_end(key)
+        return layer
+
+    @staticmethod
+    def load_artwork(artwork_data: bytes, size: Tuple[int, int] = COVER_SIZE) -> Image.Image:
+        image = Image.open(BytesIO(artwork_data))
+        image.draft('RGB', size)
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+        factor = min(image.width // size[0], image.height // size[1])
+        if factor > 1:
+            image = image.reduce(factor)
+        return image
+
+    @staticmethod
+    def blurred_background(image: Image.Image, size: Tuple[int, int], radius: int = 20) -> Image.Image:
+        width, height = size
+        background = image.resize((width // BACKGROUND_SCALE, height // BACKGROUND_SCALE), Image.BILINEAR)
+        background = background.filter(ImageFilter.GaussianBlur(radius=radius / BACKGROUND_SCALE))
+        return background.resize((width, height), Image.BILINEAR)
+
+    @staticmethod
+    def gradient_background(palette: tuple, size: Tuple[int, int]) -> Image.Image:
+        width, height = size
+        primary_color, accent_color = palette
+        columns = Image.new('RGB', (width, 1))
+        columns.putdata([
+            tuple(
+                int(primary * (1 - x / width) + accent * (x / width) * 0.3)
+                for primary, accent in zip(primary_color, accent_color)
+            )
+            for x in range(width)
+        ])
+        rows = Image.new('L', (1, height))
+        rows.putdata([round(255 * (1 - y / height * 0.2)) for y in range(height)])
+        return ImageChops.multiply(
+            columns.resize(size, Image.NEAREST),
+            rows.resize(size, Image.NEAREST).convert('RGB')
+        )
+
+    @staticmethod
+    def extract_palette(image: Image.Image) -> Tuple[tuple, tuple]:
+        image = image.resize((150, 150))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        colors = image.getcolors(150*150)
+        if not colors:
+            return DEFAULT_PALETTE
+        r, g, b = max(colors, key=lambda x: x[0])[1]
+        return (r, g, b), (min(255, r + 50), min(255, g + 50), min(255, b + 50))
+
+    def _build_music_base(self, album_art: Optional[Image.Image], palette: tuple) -> Image.Image:
+        width, height = MUSIC_BANNER_SIZE
+        primary_color, accent_color = palette
+
+        banner = Image.new('RGB', (width, height), (30, 30, 30))
+
+        if album_art:
+            bg_image = self.blurred_background(album_art, (width, height))
+            overlay = Image.new('RGBA', (width, height), (0, 0, 0, 200))
+            bg_image = Image.alpha_composite(bg_image.convert('RGBA'), overlay).convert('RGB')
+            banner.paste(bg_image)
+        else:
+            banner.paste(self.gradient_background(palette, (width, height)))
+
+        overlay = Image.new('RGBA', (width, height), (0, 0, 0, 50))
+        banner = Image.alpha_composite(banner.convert('RGBA'), overlay).convert('RGB')
+        draw = ImageDraw.Draw(banner)
+
+        if album_art:
+            shadow_offset = 8
+            shadow = Image.new('RGBA', (250 + shadow_offset, 250 + shadow_offset), (0, 0, 0, 80))
+            banner.paste(shadow, (25 + shadow_offset, 25 + shadow_offset), shadow)
+
+            border = Image.new('RGB', (254, 254), accent_color)
+            banner.paste(border, (23, 23))
+            banner.paste(album_art, (25, 25))
+        else:
+            draw.rectangle([25, 25, 275, 275], fill=accent_color, outline=(255, 255, 255), width=2)
+
+            note_size = 100
+            note_x = 150 - note_size // 2
+            note_y = 150 - note_size // 2
+            draw.ellipse([note_x, note_y + 60, note_x + 40, note_y + 100], fill=(255, 255, 255))
+            draw.rectangle([note_x + 35, note_y, note_x + 40, note_y + 70], fill=(255, 255, 255))
+            draw.ellipse([note_x + 30, note_y - 10, note_x + 50, note_y + 10], fill=(255, 255, 255))
+
+        return banner
+
+    def _music_base(self, artwork_url: Optional[str], artwork_data: Optional[bytes]) -> Tuple[Image.Image, tuple]:
+        palette = self._palettes.get(artwork_url) if artwork_url else None
+        if palette is not None:
+            layer = self._get_layer((artwork_url, palette))
+            if layer is not None:
+                self.hits += 1
+                return layer, palette
+
+        self.misses += 1
+        album_art = None
+        palette = DEFAULT_PALETTE
+        if artwork_url and artwork_data:
+            try:
+                with RENDER_LATENCY.time(stage='decode'):
+                    album_art = self.load_artwork(artwork_data)
+                    if album_art.size != COVER_SIZE:
+                        album_art = album_art.resize(COVER_SIZE)
+                    palette = self.extract_palette(album_art)
+            except Exception as e:
+                logger.error(f"[BANNER] Ошибка при обработке обложки: {e}")
+                album_art = None
+                palette = DEFAULT_PALETTE
+
+        key = (artwork_url, palette) if album_art else (None, DEFAULT_PALETTE)
+        layer = self._get_layer(key)
+        if layer is None:
+            with RENDER_LATENCY.time(stage='base'):
+                layer = self._build_music_base(album_art, palette)
+            self._remember(self._layers, key, layer)
+        if album_art:
+            self._remember(self._palettes, artwork_url, palette)
+        return layer, palette
+
+    def render_music_banner(
+        self,
+        artwork_url: Optional[str],
+        artwork_data: Optional[bytes],
+        title: str,
+        author: Optional[str],
+        length: int,
+        username: Optional[str] = None
+    ) -> Image.Image:
+        layer, (_, accent_color) = self._music_base(artwork_url, artwork_data)
+        with RENDER_LATENCY.time(stage='text'):
+            return self._draw_music_text(layer, accent_color, title, author, length, username)
+
+    def _draw_music_text(
+        self,
+        layer: Image.Image,
+        accent_color: tuple,
+        title: str,
+        author: Optional[str],
+        length: int,
+        username: Optional[str]
+    ) -> Image.Image:
+        banner = layer.copy()
+        draw = ImageDraw.Draw(banner)
+
+        title_font = self.get_font("DejaVuSans.ttf", 32)
+        artist_font = self.get_font("DejaVuSans.ttf", 24)
+        info_font = self.get_font("DejaVuSans.ttf", 18)
+        label_font = self.get_font("DejaVuSans.ttf", 14)
+
+        text_x = 300
+        current_y = 40
+
+        draw.text((text_x, current_y), "♪ СЕЙЧАС ИГРАЕТ", font=label_font, fill=accent_color)
+        current_y += 35
+
+        track_title = title if len(title) <= 35 else title[:32] + "..."
+        draw.text((text_x, current_y), track_title, font=title_font, fill=(255, 255, 255))
+        current_y += 45
+
+        if author:
+            artist_name = author if len(author) <= 40 else author[:37] + "..."
+            draw.text((text_x, current_y), f"Исполнитель: {artist_name}", font=artist_font, fill=(200, 200, 200))
+            current_y += 40
+
+        duration = time.strftime("%M:%S", time.gmtime(length / 1000))
+        draw.text((text_x, current_y), f"Длительность: {duration}", font=info_font, fill=(180, 180, 180))
+        current_y += 30
+
+        if username:
+            draw.text((text_x, current_y), f"Добавил: {username}", font=info_font, fill=(180, 180, 180))
+
+        return banner
+
+    @staticmethod
+    def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+        buffer = BytesIO()
+        if image_format == 'PNG':
+            image.save(buffer, format='PNG')
+        elif image_format == 'PNG8':
+            image.quantize(colors=256, method=Image.Quantize.MEDIANCUT).save(buffer, format='PNG', optimize=True)
+        elif image_format == 'JPEG':
+            image.convert('RGB').save(buffer, format='JPEG', quality=quality, optimize=True)
+        else:
+            image.save(buffer, format='WEBP', quality=quality, method=4)
+        return buffer.getvalue()
+
+    def encode(self, image: Image.Image, name: str) -> Tuple[BytesIO, str]:
+        start = time.perf_counter()
+        image_format = self.image_format
+        quality = self.quality
+        data = self._encode(image, image_format, quality)
+        attempts = 1
+
+        while self.max_bytes and len(data) > self.max_bytes:
+            if image_format in ('WEBP', 'JPEG') and quality > config.BANNER_MIN_QUALITY:
+                quality = max(config.BANNER_MIN_QUALITY, quality - 15)
+            elif image_format == 'PNG':
+                image_format = 'PNG8'
+            elif image_format == 'PNG8':
+                image_format = 'WEBP'
+                quality = self.quality
+            else:
+                break
+            data = self._encode(image, image_format, quality)
+            attempts += 1
+
+        elapsed = time.perf_counter() - start
+        RENDER_LATENCY.observe(elapsed, stage='encode')
+        self.render_stats.append({
+            'name': name,
+            'format': image_format,
+            'quality': quality,
+            'bytes': len(data),
+            'encode_ms': elapsed * 1000,
+            'attempts': attempts
+        })
+        logger.info(f"[BANNER] {name}: {image_format} q={quality} | {len(data)} байт | {elapsed * 1000:.1f}мс | попыток: {attempts}")
+
+        return BytesIO(data), f"{name}.{EXTENSIONS[image_format]}"
+
+    def music_banner_file(
+        self,
+        artwork_url: Optional[str],
+        artwork_data: Optional[bytes],
+        title: str,
+        author: Optional[str],
+        length: int,
+        username: Optional[str] = None
+    ) -> Tuple[BytesIO, str]:
+        with self._lock:
+            banner = self.render_music_banner(artwork_url, artwork_data, title, author, length, username)
+            return self.encode(banner, 'music_banner')
+
+    def top_banner_file(self, tracks: list, guild_name: str, artwork_data: Optional[bytes] = None) -> Tuple[BytesIO, str]:
+        with self._lock:
+            return self.encode(self.render_top_banner(tracks, guild_name, artwork_data), 'top_tracks')
+
+    def render_top_banner(self, tracks: list, guild_name: str, artwork_data: Optional[bytes] = None) -> Image.Image:
+        with RENDER_LATENCY.time(stage='top'):
+            return self._draw_top_banner(tracks, guild_name, artwork_data)
+
+    def _draw_top_banner(self, tracks: list, guild_name: str, artwork_data: Optional[bytes]) -> Image.Image:
+        width, height = TOP_BANNER_SIZE
+
+        banner = Image.new('RGB', (width, height), (30, 30, 30))
+
+        if artwork_data:
+            try:
+                album_art = self.load_artwork(artwork_data, (width // BACKGROUND_SCALE, width // BACKGROUND_SCALE))
+                bg_image = self.blurred_background(album_art, (width, height))
+                overlay = Image.new('RGBA', (width, height), (0, 0, 0, 200))
+                bg_image = Image.alpha_composite(bg_image.convert('RGBA'), overlay).convert('RGB')
+                banner.paste(bg_image)
+            except Exception as e:
+                logger.error(f"[BANNER] Ошибка при обработке фона топ-треков: {e}")
+
+        overlay = Image.new('RGBA', (width, height), (0, 0, 0, 50))
+        banner = Image.alpha_composite(banner.convert('RGBA'), overlay).convert('RGB')
+        draw = ImageDraw.Draw(banner)
+
+        title_font = self.get_font("arial.ttf", 28)
+        track_font = self.get_font("arial.ttf", 18)
+        info_font = self.get_font("arial.ttf", 14)
+
+        title = f"Самые популярные треки на {guild_name}"
+        draw.text((width//2, 20), title, font=title_font, fill=(255, 255, 255), anchor="mm")
+
+        draw.line([(50, 60), (width - 50, 60)], fill=TOP_ACCENT, width=2)
+
+        current_y = 90
+        tracks_per_column = 5
+        column_width = width // 2
+
+        for i, (track_title, track_author, play_count, _) in enumerate(tracks[:10], 1):
+            column = 0 if i <= tracks_per_column else 1
+            x_offset = 50 + (column * column_width)
+
+            draw.text((x_offset, current_y), f"#{i}", font=track_font, fill=TOP_ACCENT)
+
+            track_title = track_title if len(track_title) <= 25 else track_title[:22] + "..."
+            draw.text((x_offset + 30, current_y), track_title, font=track_font, fill=(255, 255, 255))
+
+            info_text = f"👤 {track_author} • ▶️ {play_count}"
+            draw.text((x_offset + 30, current_y + 25), info_text, font=info_font, fill=(200, 200, 200))
+
+            if i == tracks_per_column:
+                current_y = 90
+            else:
+                current_y += 50
+
+        return banner
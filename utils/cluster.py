@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+import urllib.request
+from typing import List, Optional
+
+import config
+
+logger = logging.getLogger('cluster')
+
+GATEWAY_URL = 'https://discord.com/api/v10/gateway/bot'
+
+
+class ClusterInfo:
+    def __init__(self, cluster_id: int, cluster_count: int, shard_ids: Optional[List[int]], shard_count: Optional[int]):
+        self.cluster_id = cluster_id
+        self.cluster_count = cluster_count
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+
+    @classmethod
+    def from_env(cls) -> 'ClusterInfo':
+        shard_ids = os.getenv('BOT_SHARD_IDS')
+        shard_count = os.getenv('BOT_SHARD_COUNT')
+        return cls(
+            cluster_id=int(os.getenv('BOT_CLUSTER_ID', 0)),
+            cluster_count=int(os.getenv('BOT_CLUSTER_COUNT', 1)),
+            shard_ids=[int(shard) for shard in shard_ids.split(',')] if shard_ids else None,
+            shard_count=int(shard_count) if shard_count else config.SHARD_COUNT
+        )
+
+    @property
+    def clustered(self) -> bool:
+        return self.cluster_count > 1
+
+    @property
+    def log_file(self) -> str:
+        if not self.clustered:
+            return config.LOG_FILE
+        base, ext = os.path.splitext(config.LOG_FILE)
+        return f"{base}-{self.cluster_id}{ext}"
+
+    @property
+    def metrics_port(self) -> int:
+        return config.METRICS_PORT + self.cluster_id if config.METRICS_PORT else 0
+
+    @property
+    def lavalink_node(self) -> dict:
+        node = dict(config.LAVALINK_NODES[self.cluster_id % len(config.LAVALINK_NODES)])
+        if self.clustered:
+            node['label'] = f"{node['label']}-{self.cluster_id}"
+        return node
+
+    def env(self) -> dict:
+        env = {
+            'BOT_CLUSTER_ID': str(self.cluster_id),
+            'BOT_CLUSTER_COUNT': str(self.cluster_count),
+        }
+        if self.shard_ids is not None:
+            env['BOT_SHARD_IDS'] = ','.join(map(str, self.shard_ids))
+        if self.shard_count is not None:
+            env['BOT_SHARD_COUNT'] = str(self.shard_count)
+        return env
+
+
+def recommended_shards(token: str) -> int:
+    request = urllib.request.Request(
+        GATEWAY_URL,
+        headers={'Authorization': f'Bot {token}', 'User-Agent': 'DiscordBot (music-bot, 1.0)'}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)['shards']
+
+
+def plan_clusters(cluster_count: int, shard_count: int) -> List[ClusterInfo]:
+    shard_count = max(shard_count, cluster_count)
+    per_cluster, extra = divmod(shard_count, cluster_count)
+    clusters = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        size = per_cluster + (1 if cluster_id < extra else 0)
+        clusters.append(ClusterInfo(cluster_id, cluster_count, list(range(start, start + size)), shard_count))
+        start += size
+    return clusters
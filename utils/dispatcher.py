@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+import disnake
+
+import config
+
+logger = logging.getLogger('dispatcher')
+
+
+class RateLimitCounter(logging.Filter):
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.global_count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING and isinstance(record.msg, str):
+            if record.msg.startswith('We are being rate limited'):
+                self.count += 1
+            elif record.msg.startswith('Global rate limit'):
+                self.global_count += 1
+        return True
+
+
+class _Operation:
+    __slots__ = ('kind', 'target', 'kwargs', 'future')
+
+    def __init__(self, kind: str, target, kwargs: dict):
+        self.kind = kind
+        self.target = target
+        self.kwargs = kwargs
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class _ChannelQueue:
+    __slots__ = ('ops', 'edits', 'deletes', 'history', 'worker', 'expiry')
+
+    def __init__(self, rate: int):
+        self.ops = deque()
+        self.edits = {}
+        self.deletes = {}
+        self.history = deque(maxlen=rate)
+        self.worker = None
+        self.expiry = None
+
+
+class MessageDispatcher:
+    def __init__(
+        self,
+        rate: int = config.DISPATCH_CHANNEL_RATE,
+        period: float = config.DISPATCH_CHANNEL_PERIOD
+    ):
+        self.rate = rate
+        self.period = period
+        self._channels = {}
+        self._deleted = OrderedDict()
+        self.executed = 0
+        self.merged = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rate_limits = RateLimitCounter()
+        logging.getLogger('disnake.http').addFilter(self.rate_limits)
+
+    def send(self, channel, **kwargs) -> asyncio.Future:
+        return self._enqueue(channel.id, _Operation('send', channel, kwargs))
+
+    def edit(self, message, **kwargs) -> asyncio.Future:
+        if message.id in self._deleted:
+            return self._drop()
+
+        queue = self._channels.get(message.channel.id)
+        if queue:
+            pending = queue.edits.get(message.id)
+            if pending:
+                pending.kwargs.update(kwargs)
+                self.merged += 1
+                return pending.future
+
+        operation = _Operation('edit', message, kwargs)
+        future = self._enqueue(message.channel.id, operation)
+        self._channels[message.channel.id].edits[message.id] = operation
+        return future
+
+    def delete(self, message) -> asyncio.Future:
+        if message.id in self._deleted:
+            return self._drop()
+
+        queue = self._channels.get(message.channel.id)
+        if queue:
+            pending = queue.deletes.get(message.id)
+            if pending:
+                self.merged += 1
+                return pending.future
+            edit = queue.edits.pop(message.id, None)
+            if edit:
+                queue.ops.remove(edit)
+                edit.future.set_result(None)
+                self.dropped += 1
+
+        operation = _Operation('delete', message, {})
+        future = self._enqueue(message.channel.id, operation)
+        self._channels[message.channel.id].deletes[message.id] = operation
+        return future
+
+    def stats(self) -> dict:
+        depths = [len(queue.ops) for queue in self._channels.values()]
+        return {
+            'channels': len(depths),
+            'queue_depth': sum(depths),
+            'max_queue_depth': max(depths, default=0),
+            'executed': self.executed,
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'rate_limited': self.rate_limits.count,
+            'global_rate_limited': self.rate_limits.global_count
+        }
+
+    async def close(self):
+        logging.getLogger('disnake.http').removeFilter(self.rate_limits)
+        workers = [queue.worker for queue in self._channels.values() if queue.worker]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._channels.values():
+            if queue.expiry:
+                queue.expiry.cancel()
+            for operation in queue.ops:
+                operation.future.cancel()
+        self._channels.clear()
+
+    def _drop(self) -> asyncio.Future:
+        self.dropped += 1
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    def _enqueue(self, channel_id: int, operation: _Operation) -> asyncio.Future:
+        queue = self._channels.get(channel_id)
+        if queue is None:
+            queue = self._channels[channel_id] = _ChannelQueue(self.rate)
+        if queue.expiry:
+            queue.expiry.cancel()
+            queue.expiry = None
+        queue.ops.append(operation)
+        operation.future.add_done_callback(self._log_failure)
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._work(channel_id, queue))
+        return operation.future
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error and not isinstance(error, disnake.NotFound):
+            logger.error(f"[DISPATCH] Ошибка при отправке запроса в Discord: {error}")
+
+    async def _wait_for_slot(self, queue: _ChannelQueue):
+        if len(queue.history) == self.rate:
+            delay = self.period - (time.monotonic() - queue.history[0])
+            if delay > 0:
+                await asyncio.sleep(delay)
+        queue.history.append(time.monotonic())
+
+    async def _execute(self, operation: _Operation):
+        if operation.kind == 'send':
+            return await operation.target.send(**operation.kwargs)
+        if operation.kind == 'edit':
+            return await operation.target.edit(**operation.kwargs)
+        await operation.target.delete()
+        self._mark_deleted(operation.target.id)
+
+    def _mark_deleted(self, message_id: int):
+        self._deleted[message_id] = True
+        if len(self._deleted) > 1000:
+            self._deleted.popitem(last=False)
+
+    async def _work(self, channel_id: int, queue: _ChannelQueue):
+        try:
+            while queue.ops:
+                await self._wait_for_slot(queue)
+                if not queue.ops:
+                    break
+                operation = queue.ops.popleft()
+                if operation.kind == 'edit':
+                    queue.edits.pop(operation.target.id, None)
+                elif operation.kind == 'delete':
+                    queue.deletes.pop(operation.target.id, None)
+
+                try:
+                    result = await self._execute(operation)
+                    self.executed += 1
+                    if not operation.future.done():
+                        operation.future.set_result(result)
+                except Exception as e:
+                    self.failed += 1
+                    if isinstance(e, disnake.NotFound) and operation.kind != 'send':
+                        self._mark_deleted(operation.target.id)
+                    if not operation.future.done():
+                        operation.future.set_exception(e)
+        finally:
+            if not queue.ops and self._channels.get(channel_id) is queue:
+                queue.expiry = asyncio.get_running_loop().call_later(self.period, self._expire, channel_id, queue)
+
+    def _expire(self, channel_id: int, queue: _ChannelQueue):
+        queue.expiry = None
+        idle = not queue.ops and (queue.worker is None or queue.worker.done())
+        if idle and self._channels.get(channel_id) is queue:
+            del self._channels[channel_id]
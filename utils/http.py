@@ -0,0 +1,69 @@
+import logging
+from typing import Optional
+
+import aiohttp
+
+import config
+
+logger = logging.getLogger('http')
+
+
+class HttpClient:
+    def __init__(
+        self,
+        limit: int = config.HTTP_POOL_LIMIT,
+        limit_per_host: int = config.HTTP_POOL_LIMIT_PER_HOST,
+        dns_ttl: int = config.HTTP_DNS_TTL,
+        connect_timeout: float = config.HTTP_CONNECT_TIMEOUT,
+        read_timeout: float = config.HTTP_READ_TIMEOUT,
+        max_image_bytes: int = config.HTTP_MAX_IMAGE_BYTES
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(
+            total=connect_timeout + read_timeout,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self.max_image_bytes = max_image_bytes
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def start(self):
+        return self.session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def fetch_bytes(self, url: str, max_size: Optional[int] = None) -> Optional[bytes]:
+        max_size = max_size or self.max_image_bytes
+        async with self.session.get(url) as response:
+            if response.status != 200:
+                logger.warning(f"[HTTP] {url} вернул статус {response.status}")
+                return None
+
+            if response.content_length and response.content_length > max_size:
+                logger.warning(f"[HTTP] {url} слишком большой: {response.content_length} байт")
+                return None
+
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data.extend(chunk)
+                if len(data) > max_size:
+                    logger.warning(f"[HTTP] {url} превысил лимит {max_size} байт")
+                    return None
+            return bytes(data)
@@ -0,0 +1,131 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import config
+
+CATEGORY_PATTERN = re.compile(r'\[([A-Z0-9_]+)\]')
+CONTEXT_FIELDS = ('guild_id', 'channel_id', 'user_id', 'track')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def get_category(record: logging.LogRecord) -> Optional[str]:
+    category = getattr(record, 'category', None)
+    if category is None and isinstance(record.msg, str) and record.msg.startswith('['):
+        match = CATEGORY_PATTERN.match(record.msg)
+        category = match.group(1) if match else None
+        record.category = category
+    return category
+
+
+class CategoryFilter(logging.Filter):
+    def __init__(self, levels: Dict[str, str], sample_rates: Dict[str, int]):
+        super().__init__()
+        self.levels = {name: logging.getLevelName(level) for name, level in levels.items()}
+        self.sample_rates = sample_rates
+        self._seen: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = get_category(record)
+        if category is None:
+            return True
+        if record.levelno < self.levels.get(category, logging.NOTSET):
+            return False
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = self.sample_rates.get(category, 1)
+        if rate <= 1:
+            return True
+        with self._lock:
+            seen = self._seen.get(category, 0)
+            self._seen[category] = seen + 1
+        if seen % rate:
+            return False
+        record.sampled = rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        category = get_category(record)
+        if category:
+            entry['category'] = category
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        sampled = getattr(record, 'sampled', None)
+        if sampled:
+            entry['sample_rate'] = sampled
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(
+    filename: str = config.LOG_FILE,
+    level: str = config.LOG_LEVEL,
+    json_output: bool = config.LOG_JSON
+) -> logging.handlers.QueueListener:
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        filename,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(CategoryFilter(config.LOG_CATEGORY_LEVELS, config.LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Optional
+
+import config
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger('loopmonitor')
+
+LOOP_LAG = REGISTRY.histogram(
+    'event_loop_lag_seconds', 'Задержка планирования event loop',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+LOOP_STALLS = REGISTRY.counter('event_loop_stalls_total', 'Блокировки event loop выше порога')
+
+
+def _percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class LoopLagMonitor:
+    def __init__(
+        self,
+        interval: float = config.LOOP_LAG_INTERVAL,
+        threshold: float = config.LOOP_LAG_THRESHOLD,
+        window: int = 600
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples = deque(maxlen=window)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._probe: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._captured: Optional[tuple] = None
+
+    def start(self):
+        if self._probe and not self._probe.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._probe = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+        for name, fraction in (('p50', 0.5), ('p99', 0.99)):
+            REGISTRY.gauge(f'event_loop_lag_{name}_seconds', f'Задержка event loop, {name} за окно').set_function(
+                lambda fraction=fraction: _percentile(list(self.samples), fraction)
+            )
+        REGISTRY.gauge('event_loop_lag_max_seconds', 'Максимальная задержка event loop за окно').set_function(
+            lambda: max(self.samples, default=0.0)
+        )
+        logger.info(f"[LOOP] Мониторинг задержек запущен (интервал {self.interval}s, порог {self.threshold}s)")
+
+    def stop(self):
+        self._stopped.set()
+        if self._probe:
+            self._probe.cancel()
+            self._probe = None
+        if self._watchdog:
+            self._watchdog.join(timeout=self.threshold)
+            self._watchdog = None
+
+    def percentiles(self) -> dict:
+        samples = list(self.samples)
+        return {
+            'p50': _percentile(samples, 0.5),
+            'p99': _percentile(samples, 0.99),
+            'max': max(samples, default=0.0)
+        }
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(0.0, now - expected)
+            self.samples.append(lag)
+            LOOP_LAG.observe(lag)
+
+            if lag >= self.threshold:
+                LOOP_STALLS.inc()
+                captured, self._captured = self._captured, None
+                if captured:
+                    task_name, stack = captured
+                    logger.warning(
+                        f"[LOOP] Event loop заблокирован на {lag * 1000:.0f} мс, задача: {task_name}\n{stack}"
+                    )
+                else:
+                    logger.warning(f"[LOOP] Event loop заблокирован на {lag * 1000:.0f} мс")
+
+    def _watch(self):
+        poll = self.threshold / 2
+        reported = 0.0
+        while not self._stopped.wait(poll):
+            heartbeat = self._heartbeat
+            if heartbeat == reported:
+                continue
+            if time.monotonic() - heartbeat - self.interval < self.threshold:
+                continue
+            reported = heartbeat
+            self._captured = self._capture()
+
+    def _capture(self) -> Optional[tuple]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return None
+        stack = ''.join(traceback.format_stack(frame))
+
+        task_name = 'неизвестно'
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is not None:
+            coro = task.get_coro()
+            task_name = f"{task.get_name()} ({getattr(coro, '__qualname__', coro)})"
+        else:
+            task_name = 'callback вне задачи'
+        return task_name, stack
@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import logging
+import struct
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+import config
+
+try:
+    import redis.asyncio as redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger('playerstate')
+
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+LOOP_MODES = (None, 'track', 'queue')
+HEADER = struct.Struct('!BBHBQQQQIQ')
+STRING_LENGTH = struct.Struct('!H')
+COUNT = struct.Struct('!I')
+USER_ID = struct.Struct('!Q')
+FLAG = struct.Struct('!B')
+
+
+class PlayerState:
+    __slots__ = (
+        'guild_id', 'voice_channel_id', 'text_channel_id', 'controller_message_id', 'loop_mode', 'volume',
+        'is_247', 'paused', 'last_user_id', 'last_username', 'position', 'saved_at', 'current', 'queue', 'requesters'
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        voice_channel_id: int = 0,
+        text_channel_id: int = 0,
+        controller_message_id: int = 0,
+        loop_mode: Optional[str] = None,
+        volume: int = 100,
+        is_247: bool = False,
+        paused: bool = False,
+        last_user_id: int = 0,
+        last_username: str = '',
+        position: int = 0,
+        saved_at: int = 0,
+        current: Optional[str] = None,
+        queue: Optional[List[str]] = None,
+        requesters: Optional[Dict[str, tuple]] = None
+    ):
+        self.guild_id = guild_id
+        self.voice_channel_id = voice_channel_id
+        self.text_channel_id = text_channel_id
+        self.controller_message_id = controller_message_id
+        self.loop_mode = loop_mode
+        self.volume = volume
+        self.is_247 = is_247
+        self.paused = paused
+        self.last_user_id = last_user_id
+        self.last_username = last_username
+        self.position = position
+        self.saved_at = saved_at
+        self.current = current
+        self.queue = queue or []
+        self.requesters = requesters or {}
+
+    @classmethod
+    def from_player(cls, player) -> 'PlayerState':
+        current = player.current_track
+        queue = [track.id for track in player.queue]
+        identifiers = {track.identifier for track in player.queue}
+        if current:
+            identifiers.add(current.identifier)
+        requesters = {
+            identifier: (info['user_id'] or 0, info['username'] or '', bool(info.get('radio')))
+            for identifier, info in player.track_users.items()
+            if identifier in identifiers
+        }
+        message = player.controller_message
+        return cls(
+            guild_id=player.guild.id,
+            voice_channel_id=player.channel.id if player.channel else 0,
+            text_channel_id=message.channel.id if message else 0,
+            controller_message_id=message.id if message else 0,
+            loop_mode=player.loop_mode,
+            volume=player.volume,
+            is_247=player.is_247,
+            paused=player.paused,
+            last_user_id=player.last_user_id or 0,
+            last_username=player.last_username or '',
+            position=player.position if current else 0,
+            saved_at=int(time.time() * 1000),
+            current=current.id if current else None,
+            queue=queue,
+            requesters=requesters
+        )
+
+    def estimated_position(self) -> int:
+        if self.paused or not self.saved_at:
+            return self.position
+        return self.position + max(0, int(time.time() * 1000) - self.saved_at)
+
+    def serialize(self, timing: bool = True) -> bytes:
+        flags = LOOP_MODES.index(self.loop_mode) | (0x80 if self.is_247 else 0) | (0x40 if self.paused else 0)
+        parts = [HEADER.pack(
+            FORMAT_VERSION,
+            flags,
+            self.volume,
+            0,
+            self.guild_id,
+            self.voice_channel_id,
+            self.text_channel_id,
+            self.controller_message_id,
+            self.position if timing else 0,
+            self.saved_at if timing else 0
+        )]
+        parts.append(USER_ID.pack(self.last_user_id))
+        _pack_string(parts, self.last_username)
+        _pack_string(parts, self.current or '')
+        parts.append(COUNT.pack(len(self.queue)))
+        for track_id in self.queue:
+            _pack_string(parts, track_id)
+        parts.append(COUNT.pack(len(self.requesters)))
+        for identifier, (user_id, username, radio) in self.requesters.items():
+            _pack_string(parts, identifier)
+            parts.append(USER_ID.pack(user_id))
+            _pack_string(parts, username)
+            parts.append(FLAG.pack(radio))
+        return b''.join(parts)
+
+    def encode(self) -> bytes:
+        return zlib.compress(self.serialize(), 6)
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'PlayerState':
+        buffer = memoryview(zlib.decompress(data))
+        (version, flags, volume, _, guild_id, voice_channel_id, text_channel_id,
+         controller_message_id, position, saved_at) = HEADER.unpack_from(buffer)
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported player state version {version}")
+        offset = HEADER.size
+        last_user_id, = USER_ID.unpack_from(buffer, offset)
+        offset += USER_ID.size
+        last_username, offset = _unpack_string(buffer, offset)
+        current, offset = _unpack_string(buffer, offset)
+
+        count, = COUNT.unpack_from(buffer, offset)
+        offset += COUNT.size
+        queue = []
+        for _ in range(count):
+            track_id, offset = _unpack_string(buffer, offset)
+            queue.append(track_id)
+
+        count, = COUNT.unpack_from(buffer, offset)
+        offset += COUNT.size
+        requesters = {}
+        for _ in range(count):
+            identifier, offset = _unpack_string(buffer, offset)
+            user_id, = USER_ID.unpack_from(buffer, offset)
+            offset += USER_ID.size
+            username, offset = _unpack_string(buffer, offset)
+            radio = False
+            if version > 1:
+                radio, = FLAG.unpack_from(buffer, offset)
+                offset += FLAG.size
+            requesters[identifier] = (user_id, username, bool(radio))
+
+        return cls(
+            guild_id=guild_id,
+            voice_channel_id=voice_channel_id,
+            text_channel_id=text_channel_id,
+            controller_message_id=controller_message_id,
+            loop_mode=LOOP_MODES[flags & 0x3F],
+            volume=volume,
+            is_247=bool(flags & 0x80),
+            paused=bool(flags & 0x40),
+            last_user_id=last_user_id,
+            last_username=last_username,
+            position=position,
+            saved_at=saved_at,
+            current=current or None,
+            queue=queue,
+            requesters=requesters
+        )
+
+
+def _pack_string(parts: list, value: str):
+    data = value.encode('utf-8')
+    parts.append(STRING_LENGTH.pack(len(data)))
+    parts.append(data)
+
+
+def _unpack_string(buffer: memoryview, offset: int) -> tuple:
+    length, = STRING_LENGTH.unpack_from(buffer, offset)
+    offset += STRING_LENGTH.size
+    return bytes(buffer[offset:offset + length]).decode('utf-8'), offset + length
+
+
+class MemoryStateBackend:
+    def __init__(self):
+        self.data: Dict[str, bytes] = {}
+        self.writes = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self.data.get(key)
+
+    async def set_many(self, items: Dict[str, bytes], ttl: int):
+        self.writes += 1
+        self.data.update(items)
+
+    async def delete_many(self, keys: Iterable[str]):
+        self.writes += 1
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def close(self):
+        pass
+
+
+class RedisStateBackend:
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("STATE_BACKEND='redis' requires the redis package")
+        self.client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set_many(self, items: Dict[str, bytes], ttl: int):
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ex=ttl)
+            await pipe.execute()
+
+    async def delete_many(self, keys: Iterable[str]):
+        keys = list(keys)
+        if keys:
+            await self.client.delete(*keys)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def create_backend(name: Optional[str] = config.STATE_BACKEND):
+    if name == 'memory':
+        return MemoryStateBackend()
+    if name == 'redis':
+        return RedisStateBackend(config.STATE_REDIS_URL)
+    return None
+
+
+class PlayerStateStore:
+    def __init__(self, backend, players, interval: float = config.STATE_FLUSH_INTERVAL, ttl: int = config.STATE_TTL):
+        self.backend = backend
+        self.players = players
+        self.interval = interval
+        self.ttl = ttl
+        self._digests: Dict[int, bytes] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.written = 0
+        self.bytes_written = 0
+
+    @staticmethod
+    def key(guild_id: int) -> str:
+        return f"{config.STATE_KEY_PREFIX}{guild_id}"
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.flush(prune=False)
+        finally:
+            await self.backend.close()
+
+    async def load(self, guild_id: int) -> Optional[PlayerState]:
+        data = await self.backend.get(self.key(guild_id))
+        if not data:
+            return None
+        try:
+            return PlayerState.decode(data)
+        except (ValueError, zlib.error, struct.error) as e:
+            logger.error(f"[STATE] Повреждённое состояние плеера {guild_id}: {e}")
+            return None
+
+    async def park(self, state: PlayerState):
+        self._digests.pop(state.guild_id, None)
+        await self.backend.set_many({self.key(state.guild_id): state.encode()}, self.ttl)
+
+    async def forget(self, guild_id: int):
+        self._digests.pop(guild_id, None)
+        await self.backend.delete_many([self.key(guild_id)])
+
+    async def flush(self, prune: bool = True):
+        changed = {}
+        seen = set()
+        for player in self.players():
+            if not player.current_track and not player.queue:
+                continue
+            guild_id = player.guild.id
+            seen.add(guild_id)
+            state = PlayerState.from_player(player)
+            digest = hashlib.blake2b(state.serialize(timing=False), digest_size=16).digest()
+            if self._digests.get(guild_id) != digest:
+                self._digests[guild_id] = digest
+                changed[self.key(guild_id)] = state.encode()
+
+        gone = [guild_id for guild_id in self._digests if guild_id not in seen] if prune else []
+        for guild_id in gone:
+            del self._digests[guild_id]
+
+        if changed:
+            await self.backend.set_many(changed, self.ttl)
+            self.written += len(changed)
+            self.bytes_written += sum(len(data) for data in changed.values())
+        if gone:
+            await self.backend.delete_many(self.key(guild_id) for guild_id in gone)
+        self.flushes += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[STATE] Ошибка при сохранении состояния плееров: {e}")
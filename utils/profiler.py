@@ -0,0 +1,94 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+import config
+
+logger = logging.getLogger('profiler')
+
+
+class SamplingProfiler:
+    def __init__(
+        self,
+        interval: float = config.PROFILE_INTERVAL,
+        max_duration: float = config.PROFILE_MAX_DURATION,
+        max_depth: int = 64
+    ):
+        self.interval = interval
+        self.max_duration = max_duration
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def pending(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("Профилировщик уже запущен")
+        self.stacks.clear()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self.finished_at = 0.0
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        logger.info(f"[PROFILE] Запущен (интервал {self.interval * 1000:.0f} мс, максимум {self.max_duration}s)")
+
+    def stop(self) -> bytes:
+        if not self.pending:
+            raise RuntimeError("Профилировщик не запущен")
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        logger.info(f"[PROFILE] Остановлен: {self.samples} сэмплов, {len(self.stacks)} уникальных стеков")
+        return self.collapsed()
+
+    def collapsed(self) -> bytes:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at or time.monotonic()
+        return end - self.started_at if self.started_at else 0.0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        deadline = self.started_at + self.max_duration
+        names = {}
+        while not self._stopped.wait(self.interval):
+            if time.monotonic() >= deadline:
+                logger.info("[PROFILE] Достигнута максимальная длительность, сбор остановлен")
+                break
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                self.stacks[self._fold(names.get(thread_id, str(thread_id)), frame)] += 1
+            self.samples += 1
+        self.finished_at = time.monotonic()
+
+    def _fold(self, thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name)
+        parts.reverse()
+        return ';'.join(part.replace(';', ':') for part in parts)
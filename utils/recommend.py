@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import logging
+import math
+import time
+from array import array
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger('recommend')
+
+COMPACT_THRESHOLD = 500_000
+
+
+def item_key(title: str, author: Optional[str]) -> tuple:
+    return ((title or '').casefold(), (author or '').casefold())
+
+
+class RecommendationIndex:
+    def __init__(
+        self,
+        window: int = config.RECOMMEND_WINDOW,
+        session_gap: int = config.RECOMMEND_SESSION_GAP,
+        neighbors: int = config.RECOMMEND_NEIGHBORS
+    ):
+        self.window = window
+        self.session_gap = session_gap
+        self.neighbors = neighbors
+        self.items: Dict[tuple, int] = {}
+        self.labels: List[Tuple[str, Optional[str]]] = []
+        self.plays: List[int] = []
+        self.rows_ids: List[array] = []
+        self.rows_weights: List[array] = []
+        self.pending: List[Dict[int, float]] = []
+        self.pending_entries = 0
+        self.compacted_entries = 0
+        self.last_id = 0
+        self.version = -1
+        self.rows = 0
+        self.used = time.monotonic()
+        self.lock = asyncio.Lock()
+        self._sessions: Dict[int, tuple] = {}
+        self._similar: Dict[int, list] = {}
+
+    def _item(self, title: str, author: Optional[str]) -> int:
+        key = item_key(title, author)
+        item = self.items.get(key)
+        if item is None:
+            item = self.items[key] = len(self.labels)
+            self.labels.append((title, author))
+            self.plays.append(0)
+            self.rows_ids.append(array('I'))
+            self.rows_weights.append(array('f'))
+            self.pending.append({})
+        return item
+
+    def ingest(self, rows: Iterable[tuple]):
+        sessions = self._sessions
+        pending = self.pending
+        similar = self._similar
+        entries = 0
+        for row_id, user_id, played_at, title, author in rows:
+            item = self._item(title, author)
+            self.plays[item] += 1
+            session = sessions.get(user_id)
+            if session is None or played_at - session[0] > self.session_gap:
+                recent = deque(maxlen=self.window)
+            else:
+                recent = session[1]
+
+            row = pending[item]
+            for distance, other in enumerate(reversed(recent), 1):
+                if other == item:
+                    continue
+                weight = 1.0 / distance
+                if other not in row:
+                    entries += 2
+                row[other] = row.get(other, 0.0) + weight
+                other_row = pending[other]
+                other_row[item] = other_row.get(item, 0.0) + weight
+                similar.pop(other, None)
+            similar.pop(item, None)
+
+            recent.append(item)
+            sessions[user_id] = (played_at, recent)
+            self.last_id = row_id
+            self.rows += 1
+
+        self.pending_entries += entries
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.pending_entries > max(COMPACT_THRESHOLD, self.compacted_entries)
+
+    def row(self, item: int) -> Dict[int, float]:
+        row = dict(zip(self.rows_ids[item], self.rows_weights[item]))
+        for other, weight in self.pending[item].items():
+            row[other] = row.get(other, 0.0) + weight
+        return row
+
+    def compact(self):
+        for item, pending in enumerate(self.pending):
+            if not pending:
+                continue
+            row = self.row(item)
+            ids = sorted(row)
+            self.rows_ids[item] = array('I', ids)
+            self.rows_weights[item] = array('f', [row[other] for other in ids])
+            self.pending[item] = {}
+        self.pending_entries = 0
+        self.compacted_entries = sum(len(ids) for ids in self.rows_ids)
+
+    def similar(self, item: int) -> list:
+        cached = self._similar.get(item)
+        if cached is not None:
+            return cached
+        plays = self.plays
+        norm = plays[item]
+        scored = heapq.nlargest(
+            self.neighbors,
+            ((weight / math.sqrt(norm * plays[other]), other) for other, weight in self.row(item).items())
+        )
+        result = self._similar[item] = [(other, score) for score, other in scored]
+        return result
+
+    def similar_to(self, title: str, author: Optional[str], limit: int) -> List[tuple]:
+        item = self.items.get(item_key(title, author))
+        if item is None:
+            return []
+        return [(*self.labels[other], score) for other, score in self.similar(item)[:limit]]
+
+    def recommend(self, seeds: Iterable[tuple], limit: int, exclude: Iterable[tuple] = ()) -> List[tuple]:
+        keys = (item_key(title, author) for title, author in exclude)
+        excluded = {self.items[key] for key in keys if key in self.items}
+        scores = defaultdict(float)
+        for title, author in seeds:
+            item = self.items.get(item_key(title, author))
+            if item is None:
+                continue
+            excluded.add(item)
+            for other, score in self.similar(item):
+                scores[other] += score
+        best = heapq.nlargest(
+            limit,
+            ((score, other) for other, score in scores.items() if other not in excluded)
+        )
+        return [self.labels[other] for _, other in best]
+
+    def stats(self) -> dict:
+        return {
+            'rows': self.rows,
+            'items': len(self.labels),
+            'pairs': self.compacted_entries + self.pending_entries,
+            'cached': len(self._similar),
+        }
+
+
+class RecommendationEngine:
+    def __init__(
+        self,
+        db,
+        batch_size: int = config.RECOMMEND_BATCH_SIZE,
+        interval: float = config.RECOMMEND_REFRESH_INTERVAL,
+        guilds: int = config.RECOMMEND_GUILDS,
+        idle_timeout: float = config.RECOMMEND_IDLE_TIMEOUT
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.guilds = guilds
+        self.idle_timeout = idle_timeout
+        self.indexes: OrderedDict = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def index(self, guild_id: int) -> RecommendationIndex:
+        index = self.indexes.get(guild_id)
+        if index is None:
+            index = self.indexes[guild_id] = RecommendationIndex()
+            while len(self.indexes) > self.guilds:
+                self.indexes.popitem(last=False)
+        else:
+            self.indexes.move_to_end(guild_id)
+        index.used = time.monotonic()
+        return index
+
+    async def ensure(self, guild_id: int, force: bool = False) -> RecommendationIndex:
+        return await self._update(guild_id, self.index(guild_id), force)
+
+    async def _update(self, guild_id: int, index: RecommendationIndex, force: bool = False) -> RecommendationIndex:
+        version = self.db.get_history_version(guild_id)
+        if index.version == version and not force:
+            return index
+        async with index.lock:
+            if index.version == version and not force:
+                return index
+            started = time.perf_counter()
+            before = index.rows
+            while True:
+                rows = await self.db.get_history_since(guild_id, index.last_id, self.batch_size)
+                await asyncio.to_thread(index.ingest, rows)
+                if index.needs_compaction:
+                    await asyncio.to_thread(index.compact)
+                if len(rows) < self.batch_size:
+                    break
+            index.version = version
+            if index.rows > before:
+                logger.info(
+                    f"[RECOMMEND] Индекс гильдии {guild_id} обновлён: +{index.rows - before} записей "
+                    f"за {(time.perf_counter() - started) * 1000:.0f} мс, треков: {len(index.labels)}"
+                )
+        return index
+
+    async def similar_to(self, guild_id: int, title: str, author: Optional[str], limit: int) -> List[tuple]:
+        index = await self.ensure(guild_id)
+        async with index.lock:
+            return index.similar_to(title, author, limit)
+
+    async def recommend(self, guild_id: int, seeds: list, limit: int, exclude: Iterable[tuple] = ()) -> List[tuple]:
+        index = await self.ensure(guild_id)
+        async with index.lock:
+            return index.recommend(seeds, limit, exclude)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            for guild_id, index in list(self.indexes.items()):
+                if now - index.used > self.idle_timeout:
+                    if self.indexes.get(guild_id) is index:
+                        del self.indexes[guild_id]
+                        logger.info(f"[RECOMMEND] Индекс гильдии {guild_id} выгружен после простоя")
+                    continue
+                try:
+                    await self._update(guild_id, index, force=True)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"[RECOMMEND] Ошибка при обновлении индекса гильдии {guild_id}: {e}")